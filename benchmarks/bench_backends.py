@@ -0,0 +1,247 @@
+#
+# foris-controller-sentinel-module
+# Copyright (C) 2025 CZ.NIC, z.s.p.o. (http://www.nic.cz/)
+#
+# This program is free software; you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation; either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program; if not, write to the Free Software Foundation,
+# Inc., 51 Franklin Street, Fifth Floor, Boston, MA 02110-1301  USA
+#
+
+""" Micro-benchmarks of sentinel backends
+
+Backends are called directly (without message bus) against copies of
+tests/uci_configs and tests/test_root. Fake sentinel-status and
+sentinel-reload scripts are used instead of the real ones.
+
+Besides latency and allocations, the work done by a single call is counted
+(uci reads, package list builds, subprocesses and eula reads, see metrics).
+Unlike latency it doesn't depend on the machine, so the expected work is
+recorded in benchmarks/baseline.json and checked by the test suite.
+Latency baselines need to be recorded on the device itself.
+
+Usage:
+    python3 benchmarks/bench_backends.py [-n 200] [--save-baseline FILE] [--compare FILE]
+"""
+
+import argparse
+import collections
+import gc
+import json
+import os
+import shutil
+import statistics
+import sys
+import tempfile
+import textwrap
+import threading
+import time
+import tracemalloc
+import typing
+
+TESTS_DIR = os.path.join(os.path.dirname(os.path.dirname(os.path.realpath(__file__))), "tests")
+BASELINE = os.path.join(os.path.dirname(os.path.realpath(__file__)), "baseline.json")
+
+SENTINEL_STATUS = """\
+    #!/bin/sh
+    echo "FWLogs: RUNNING"
+    echo "Minipot: SENDING"
+    echo "Turris Survey: DISABLED"
+    echo "Server Connection: RUNNING"
+"""
+
+# allowed slowdown of median compared to baseline
+TOLERANCE = 1.25
+
+
+def prepare_root(tmpdir: str) -> typing.Dict[str, str]:
+    """ Copy test fixtures to tmpdir
+
+    :returns: environment variables which point backends to them
+    """
+    root = os.path.join(tmpdir, "root")
+    shutil.copytree(os.path.join(TESTS_DIR, "test_root"), root, symlinks=True)
+    status_path = os.path.join(root, "usr", "bin", "sentinel-status")
+    with open(status_path, "w") as f:
+        f.write(textwrap.dedent(SENTINEL_STATUS))
+    os.chmod(status_path, 0o755)
+
+    uci_dir = os.path.join(tmpdir, "uci_configs")
+    shutil.copytree(os.path.join(TESTS_DIR, "uci_configs"), uci_dir)
+
+    # the same variables which foris-controller-testtools set for the controller
+    return {
+        "FORIS_FILE_ROOT": root,
+        "FORIS_CMDLINE_ROOT": root,
+        "FORIS_UCI_CONFIG_DIR": uci_dir,
+    }
+
+
+class WorkCounter:
+    """ Counts stages of sentinel actions (see metrics) done by the calling thread
+
+    Stages done by background threads (reloads, state monitor) are not counted.
+    """
+
+    def __init__(self):
+        from foris_controller_sentinel_module.metrics import metrics
+
+        self._metrics = metrics
+        self._thread = threading.get_ident()
+        self.counts: typing.Counter[str] = collections.Counter()
+
+    def _record(self, stage: str, duration_ms: float):
+        if threading.get_ident() == self._thread:
+            self.counts[stage] += 1
+        type(self._metrics).record(self._metrics, stage, duration_ms)
+
+    def __enter__(self) -> "WorkCounter":
+        self._metrics.record = self._record
+        return self
+
+    def __exit__(self, *exc):
+        del self._metrics.record
+
+
+def measure(func: typing.Callable[[], typing.Any], count: int) -> dict:
+    """ Latency percentiles (in ms), allocations and work done by a single call """
+    func()  # warm up
+
+    latencies = []
+    for _ in range(count):
+        start = time.perf_counter()
+        func()
+        latencies.append((time.perf_counter() - start) * 1000)
+
+    # blocks are counted without tracemalloc, its own allocations would be counted too
+    gc.collect()
+    blocks = sys.getallocatedblocks()
+    func()
+    gc.collect()
+    blocks = sys.getallocatedblocks() - blocks
+
+    tracemalloc.start()
+    func()
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+
+    with WorkCounter() as counter:
+        func()
+
+    percentiles = statistics.quantiles(latencies, n=100)
+    return {
+        "p50": round(percentiles[49], 4),
+        "p90": round(percentiles[89], 4),
+        "p99": round(percentiles[98], 4),
+        "peak_bytes": peak,
+        "retained_blocks": blocks,
+        "work": dict(sorted(counter.counts.items())),
+    }
+
+
+def benchmarks() -> typing.Dict[str, typing.Callable[[], typing.Any]]:
+    from foris_controller_backends.sentinel import SentinelEulas, SentinelStatus, SentinelUci
+
+    uci = SentinelUci()
+    status = SentinelStatus()
+    # the state is served from memory, periodic probes would only add noise
+    status.INTERVAL = 3600.0
+    eulas = SentinelEulas()
+
+    modules = {
+        "minipot": {"enabled": True, "protocols": {"ftp": True, "http": True, "smtp": True, "telnet": True}},
+        "fwlogs": {"enabled": True},
+        "survey": {"enabled": True},
+    }
+
+    def update_settings():
+        # always change something so the config is written
+        modules["survey"]["enabled"] = not modules["survey"]["enabled"]
+        uci.update_settings(1, modules, "a" * 64)
+
+    def get_settings_cold():
+        SentinelUci.invalidate_config()
+        SentinelUci._installed_cache = None
+        uci.get_settings()
+
+    def get_eula_cold():
+        SentinelEulas._catalogue = None
+        eulas.get_eula()
+
+    # update_settings is the last one, its reloads run in background
+    return {
+        "get_settings": uci.get_settings,
+        "get_settings_cold": get_settings_cold,
+        "get_fakepot_settings": uci.get_fakepot_settings,
+        "get_eula": eulas.get_eula,
+        "get_eula_cold": get_eula_cold,
+        "get_state": status.get_state,
+        "get_state_probe": status.probe,
+        "update_settings": update_settings,
+    }
+
+
+def compare(results: dict, baseline: dict) -> typing.List[str]:
+    """ Regressions against baseline, any part of a baseline entry (p50, work) may be missing """
+    regressions = []
+    for name, result in results.items():
+        if name not in baseline:
+            continue
+        expected = baseline[name]
+        if "p50" in expected and result["p50"] > expected["p50"] * TOLERANCE:
+            regressions.append(f"{name}: p50 {result['p50']}ms (baseline {expected['p50']}ms)")
+        for stage, count in result["work"].items():
+            if "work" in expected and count > expected["work"].get(stage, 0):
+                regressions.append(f"{name}: {count}x {stage} (baseline {expected['work'].get(stage, 0)}x)")
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Sentinel backends micro-benchmarks")
+    parser.add_argument("-n", "--count", type=int, default=200, help="number of calls per benchmark")
+    parser.add_argument("-k", "--filter", default="", help="run only benchmarks containing this string")
+    parser.add_argument("--save-baseline", metavar="FILE", help="store results as a baseline")
+    parser.add_argument(
+        "--compare", metavar="FILE", nargs="?", const=BASELINE,
+        help="compare results with a baseline (benchmarks/baseline.json when FILE is omitted)",
+    )
+    options = parser.parse_args()
+
+    with tempfile.TemporaryDirectory(prefix="sentinel-bench-") as tmpdir:
+        os.environ.update(prepare_root(tmpdir))
+
+        results = {}
+        for name, func in benchmarks().items():
+            if options.filter not in name:
+                continue
+            results[name] = measure(func, options.count)
+            print(
+                f"{name:<24} p50 {results[name]['p50']:>9.3f}ms  p90 {results[name]['p90']:>9.3f}ms  "
+                f"p99 {results[name]['p99']:>9.3f}ms  peak {results[name]['peak_bytes']:>8}B  "
+                f"retained blocks {results[name]['retained_blocks']:>5}  work {results[name]['work']}"
+            )
+
+    if options.save_baseline:
+        with open(options.save_baseline, "w") as f:
+            json.dump(results, f, indent=4, sort_keys=True)
+
+    if options.compare:
+        with open(options.compare) as f:
+            regressions = compare(results, json.load(f))
+        for regression in regressions:
+            print(f"REGRESSION {regression}")
+        if regressions:
+            sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,76 @@
+#
+# foris-controller-sentinel-module
+# Copyright (C) 2025 CZ.NIC, z.s.p.o. (http://www.nic.cz/)
+#
+# This program is free software; you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation; either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program; if not, write to the Free Software Foundation,
+# Inc., 51 Franklin Street, Fifth Floor, Boston, MA 02110-1301  USA
+#
+
+""" Import time of the sentinel module
+
+Measures (in fresh interpreters) how long it takes to import what
+foris-controller imports at boot (module and handlers) compared to
+importing the backends as well, which now happens in background after
+the module is registered.
+
+Usage:
+    python3 benchmarks/bench_import.py [-n 10]
+"""
+
+import argparse
+import statistics
+import subprocess
+import sys
+
+SNIPPET = """\
+import time
+start = time.perf_counter()
+{imports}
+print(time.perf_counter() - start)
+"""
+
+CASES = {
+    "boot (module + handlers)": [
+        "import foris_controller_modules.sentinel",
+        "import foris_controller_modules.sentinel.handlers",
+    ],
+    "background (+ backends)": [
+        "import foris_controller_modules.sentinel",
+        "import foris_controller_modules.sentinel.handlers",
+        "import foris_controller_backends.sentinel",
+    ],
+}
+
+
+def measure(imports: list, count: int) -> float:
+    """ Median of import time in ms """
+    code = SNIPPET.format(imports="\n".join(imports))
+    times = []
+    for _ in range(count):
+        out = subprocess.run([sys.executable, "-c", code], check=True, capture_output=True, text=True).stdout
+        times.append(float(out) * 1000)
+    return statistics.median(times)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Sentinel module import time")
+    parser.add_argument("-n", "--count", type=int, default=10, help="number of interpreters per case")
+    options = parser.parse_args()
+
+    for name, imports in CASES.items():
+        print(f"{name:<28} {measure(imports, options.count):>9.2f}ms")
+
+
+if __name__ == "__main__":
+    main()
@@ -20,47 +20,341 @@
 import logging
 import typing
 import csv
+import functools
+import hashlib
+import json
 import os
 import re
+import threading
+import time
 
 from io import StringIO
 from secrets import token_hex
 
-from foris_controller_backends.cmdline import BaseCmdLine, BackendCommandFailed
-from foris_controller_backends.files import BaseFile
-from foris_controller_backends.uci import UciBackend, get_option_named, parse_bool, store_bool
+from foris_controller_backends.files import BaseFile, inject_file_root
+from foris_controller_backends.uci import UciBackend, parse_bool, store_bool
 from foris_controller_backends.updater import Updater
 from foris_controller_backends.web import WebUciCommands
+from foris_controller_sentinel_module.metrics import metrics
+from foris_controller_sentinel_module.revisions import SettingsRevisions, revision_of
+
+from .commands import CircuitBreaker, CommandFailed, CommandTimeout, command_path, run_command
+from .history import StateHistory
+from .watcher import ConfigWatcher
 
 logger = logging.getLogger(__name__)
 
+_DEFAULT_UCI_CONFIG_DIR = "/etc/config"
+
+
+def _uci_config_path(config: str) -> str:
+    """ Path to the file which holds the given uci config """
+    config_dir = getattr(UciBackend(), "config_dir", None) or _DEFAULT_UCI_CONFIG_DIR
+    return os.path.join(config_dir, config)
+
+
+def _stat_key(paths: typing.Iterable[str]) -> tuple:
+    """ Key which changes whenever any of the files is modified or replaced """
+    res = []
+    for path in paths:
+        try:
+            stat = os.stat(path)
+            res.append((stat.st_mtime_ns, stat.st_ino, stat.st_size))
+        except OSError:
+            res.append(None)
+    return tuple(res)
+
+
+class SentinelConfig:
+    """ Parsed snapshot of sentinel uci config
+
+    Sections are indexed by name so options can be looked up without
+    walking the whole config.
+    """
+
+    def __init__(self, data: dict, key: tuple = ()):
+        self.data = data
+        self.key = key
+        self.sections = {
+            section["name"]: section["data"]
+            for section in data.get("sentinel", {}).get("sections", [])
+        }
+        # content hash of the config
+        self.revision = revision_of(self.sections)
+
+    def get(self, section: str, option: str, default: typing.Optional[str] = None):
+        """ Same as get_option_named(data, "sentinel", section, option, default) """
+        try:
+            return self.sections[section][option]
+        except KeyError:
+            return default
+
+
+class SentinelReloader:
+    """ Reloads sentinel components in background
+
+    Reload requests which arrive within DEBOUNCE seconds from each other are
+    merged into a single reload. The result is passed to notify function
+    as a "reload" notification.
+    """
+    DEBOUNCE = 1.0
+    # seconds to wait for a single reload command
+    TIMEOUT = 60.0
+
+    # commands which reload a single component, they are run in this order
+    _COMPONENT_COMMANDS = {
+        "minipot": ["/etc/init.d/sentinel-minipot", "restart"],
+        "fwlogs": ["/etc/init.d/sentinel-fwlogs", "restart"],
+        "survey": ["/etc/init.d/sentinel-survey", "restart"],
+        "proxy": ["/etc/init.d/sentinel-proxy", "restart"],
+        # regenerates sentinel firewall rules (once the components run with the new config)
+        "firewall": ["/etc/init.d/firewall", "reload"],
+    }
+
+    def __init__(self):
+        self.notify: typing.Optional[typing.Callable[[str, dict], None]] = None
+        # called once components are reloaded
+        self.on_reload: typing.Optional[typing.Callable[[], None]] = None
+        self._condition = threading.Condition()
+        self._deadline: typing.Optional[float] = None
+        # components to be reloaded, None means all of them
+        self._components: typing.Optional[typing.Set[str]] = None
+        self._worker: typing.Optional[threading.Thread] = None
+
+    def schedule(self, components: typing.Optional[typing.Iterable[str]] = None):
+        """ Request reload, returns immediately
+
+        :param components: components which need to be reloaded, None to reload all of them
+        """
+        with self._condition:
+            if components is None or any(e not in self._COMPONENT_COMMANDS for e in components):
+                self._components = None
+            elif self._deadline is None:
+                self._components = set(components)
+            elif self._components is not None:
+                self._components.update(components)
+
+            self._deadline = time.monotonic() + self.DEBOUNCE
+            if self._worker is None or not self._worker.is_alive():
+                self._worker = threading.Thread(target=self._run, name="sentinel-reload", daemon=True)
+                self._worker.start()
+            self._condition.notify()
+
+    def _run(self):
+        while True:
+            with self._condition:
+                while self._deadline is None:
+                    self._condition.wait()
+                # wait until no other request came for DEBOUNCE seconds
+                while True:
+                    remaining = self._deadline - time.monotonic()
+                    if remaining <= 0:
+                        break
+                    self._condition.wait(remaining)
+                self._deadline = None
+                components, self._components = self._components, None
+
+            result = self.reload(components)
+            try:
+                self._send(result, components)
+                if self.on_reload:
+                    self.on_reload()
+            except Exception:
+                logger.exception("Failed to handle reload of sentinel components")
+
+    def reload(self, components: typing.Optional[typing.Set[str]] = None) -> bool:
+        if components is None:
+            commands = [["/usr/bin/sentinel-reload"]]
+        else:
+            commands = [command for name, command in self._COMPONENT_COMMANDS.items() if name in components]
+
+        try:
+            for command in commands:
+                with metrics.measure("subprocess"):
+                    retval, _, stderr = run_command(command, self.TIMEOUT)
+                if retval != 0:
+                    logger.error("'%s' failed (%d): %s", " ".join(command), retval, stderr.decode("utf8", "replace"))
+                    return False
+        except (OSError, CommandTimeout):
+            logger.exception("Failed to reload sentinel components")
+            return False
+        return True
+
+    def _send(self, result: bool, components: typing.Optional[typing.Set[str]]):
+        if self.notify:
+            data = {"result": result}
+            if components is not None:
+                data["components"] = sorted(components)
+            self.notify("reload", data)
+
 
 class SentinelUci:
     _MINIPOT_PROTOCOLS = ["ftp", "http", "smtp", "telnet"]
     _SENTINEL_MODULES = ["minipot", "fwlogs", "survey"]
 
-    def _read_uci(self):
-        with UciBackend() as backend:
-            return backend.read("sentinel")
+    # components which need to be reloaded when an option changes
+    # (section, None) matches any option of the section, None means all components
+    # Firewall rules are generated for enabled modules and minipot ports,
+    # so the firewall is reloaded after such a component is restarted.
+    _RELOADED_COMPONENTS: typing.Dict[typing.Tuple[str, typing.Optional[str]], typing.Optional[typing.Set[str]]] = {
+        ("main", "device_token"): {"proxy"},
+        ("minipot", None): {"minipot", "firewall"},
+        ("fwlogs", "enabled"): {"fwlogs", "firewall"},
+        ("survey", "enabled"): {"survey", "firewall"},
+        # fakepot is not a sentinel component
+        ("fakepot", None): set(),
+    }
+    _PACKAGE_LISTS_DEFINITIONS = "/usr/share/updater/pkglists.json"
+
+    # values which are used when an option is missing in the config
+    _DEFAULTS = {
+        ("main", "agreed_with_eula_version"): "0",
+        **{(module, "enabled"): "1" for module in _SENTINEL_MODULES},
+        ("fakepot", "enabled"): "0",
+        ("fakepot", "extra_option"): "",
+    }
+
+    # (sources key, {module: installed})
+    _installed_cache: typing.Optional[typing.Tuple[tuple, typing.Dict[str, bool]]] = None
+    _config: typing.Optional[SentinelConfig] = None
+
+    reloader = SentinelReloader()
+    revisions = SettingsRevisions()
+
+    notify: typing.Optional[typing.Callable[[str, dict], None]] = None
+    _watcher: typing.Optional[ConfigWatcher] = None
+    # config as the controller knows it (after its own writes), changes
+    # made outside of the controller are compared to it
+    _baseline: typing.Optional[SentinelConfig] = None
+    _write_lock = threading.Lock()
+
+    @staticmethod
+    def _config_key() -> tuple:
+        return _stat_key([_uci_config_path("sentinel")])
+
+    @staticmethod
+    def read_config(backend: typing.Optional[UciBackend] = None) -> SentinelConfig:
+        """ Get snapshot of sentinel config
+
+        The snapshot is shared until the config file is modified or replaced.
+        When a backend is passed, the config is read through it (if needed)
+        instead of opening a new one.
+        """
+        key = SentinelUci._config_key()
+        config = SentinelUci._config
+        if config is not None and config.key == key:
+            return config
+
+        with metrics.measure("uci_read"):
+            if backend is None:
+                with UciBackend() as backend:
+                    data = backend.read("sentinel")
+            else:
+                data = backend.read("sentinel")
+
+        config = SentinelConfig(data, key)
+        SentinelUci._config = config
+        return config
+
+    @staticmethod
+    def invalidate_config():
+        SentinelUci._config = None
+
+    def watch(self):
+        """ Start watching the config file for changes made outside of the controller """
+        with SentinelUci._write_lock:
+            if SentinelUci._watcher is not None:
+                return
+            SentinelUci._baseline = self.read_config()
+            SentinelUci._watcher = ConfigWatcher(_uci_config_path("sentinel"), self._config_changed)
+        SentinelUci._watcher.start()
+
+    @staticmethod
+    def _changed_options(old: SentinelConfig, new: SentinelConfig) -> typing.List[str]:
+        """ Options which differ between two configs in "<section>.<option>" format """
+        res = []
+        for section in sorted(old.sections.keys() | new.sections.keys()):
+            old_options, new_options = old.sections.get(section, {}), new.sections.get(section, {})
+            for option in sorted(old_options.keys() | new_options.keys()):
+                if old_options.get(option) != new_options.get(option):
+                    res.append(f"{section}.{option}")
+        return res
+
+    def _config_changed(self):
+        with SentinelUci._write_lock:
+            self.invalidate_config()
+            config = self.read_config()
+            previous, SentinelUci._baseline = SentinelUci._baseline, config
 
-    def get_settings(self):
-        data = self._read_uci()
-        eula = int(get_option_named(data, "sentinel", "main", "agreed_with_eula_version", "0"))
-        token = get_option_named(data, "sentinel", "main", "device_token", "") or None
+        # own writes are already in the baseline
+        changes = self._changed_options(previous, config)
+        if not changes:
+            return
+
+        logger.debug("Sentinel config was changed outside of the controller: %s", changes)
+        if self.notify:
+            # not coalesced with update_settings of the controller, so no changes are lost
+            self.notify("config_changed", {
+                "eula": int(config.get("main", "agreed_with_eula_version", "0")),
+                "changes": changes,
+                "sections": sorted({change.split(".", 1)[0] for change in changes}),
+            })
+
+    @staticmethod
+    def _package_lists_sources() -> typing.List[str]:
+        """ Files from which updater builds the package lists
+
+        Definitions of the lists come from pkglists.json, which lists and
+        options are enabled is stored in the pkglists config (older updater
+        kept the enabled lists in the updater config).
+        """
+        return [
+            _uci_config_path("pkglists"),
+            _uci_config_path("updater"),
+            inject_file_root(SentinelUci._PACKAGE_LISTS_DEFINITIONS),
+        ]
+
+    @staticmethod
+    def _get_installed_modules() -> typing.Dict[str, bool]:
+        """ Which sentinel modules are selected in the datacollect package list
+
+        Building the package lists is expensive, so the result is cached until
+        any of the package lists sources is modified.
+        """
+        key = _stat_key(SentinelUci._package_lists_sources())
+        cached = SentinelUci._installed_cache
+        if cached is not None and cached[0] == key:
+            return cached[1]
 
         # Do not need correct language version for this purpose
-        packages_lists = Updater.get_package_lists("en")
-        datacollect = list(filter(lambda x: x["name"] == "datacollect", packages_lists))
-        packages = datacollect[0]["options"]
+        installed = {}
+        with metrics.measure("package_lists"):
+            package_lists = Updater.get_package_lists("en")
+        for package_list in package_lists:
+            if package_list["name"] == "datacollect":
+                installed = {
+                    pkg["name"]: pkg["enabled"]
+                    for pkg in package_list["options"] if pkg["name"] in SentinelUci._SENTINEL_MODULES
+                }
+                break
+
+        SentinelUci._installed_cache = (key, installed)
+        return installed
+
+    def get_settings(self, config: typing.Optional[SentinelConfig] = None):
+        config = config or self.read_config()
+        eula = int(config.get("main", "agreed_with_eula_version", "0"))
+        token = config.get("main", "device_token", "") or None
+
         modules = {
-            pkg["name"]: {
-                "installed": pkg["enabled"],
-                "enabled": parse_bool(get_option_named(data, "sentinel", pkg["name"], "enabled", "1"))
-            } for pkg in packages if pkg["name"] in SentinelUci._SENTINEL_MODULES
+            name: {
+                "installed": installed,
+                "enabled": parse_bool(config.get(name, "enabled", "1"))
+            } for name, installed in SentinelUci._get_installed_modules().items()
         }
 
         protocols = {
-            protocol : False if get_option_named(data, "sentinel", "minipot", f"{protocol}_port", "1") == "0" else True
+            protocol : False if config.get("minipot", f"{protocol}_port", "1") == "0" else True
             for protocol in SentinelUci._MINIPOT_PROTOCOLS
         }
 
@@ -72,73 +366,234 @@ class SentinelUci:
             "modules": modules
         }
 
-    def update_settings(self, eula, modules=None, token=None):
+    def get_settings_since(self, since_revision: typing.Optional[str] = None) -> dict:
+        """ Get settings with their revision, only changes when the client has an older revision """
+        config = self.read_config()
+        settings = self.get_settings(config)
+        # installed modules are a part of settings too
+        revision = revision_of(config.revision, SentinelUci._get_installed_modules())
+        return self.revisions.reply(revision, settings, since_revision)
 
-        valid_eulas = [e[0] for e in SentinelEulas.get_valid_eulas()]
-        if eula not in valid_eulas:
-            data = self.get_settings()
-            return False, data["eula"], None
-
-        with UciBackend() as backend:
-            data = backend.read("sentinel")
-
-            backend.add_section("sentinel", "main", "main")
-            # TODO check whether eula number matches current eula number
-            backend.set_option("sentinel", "main", "agreed_with_eula_version", eula)
-
-            # update token
-            data = backend.read("sentinel")
-            stored_token = get_option_named(data, "sentinel", "main", "device_token", "") or None
-            if token is None and stored_token is None:
-                logger.debug("Generating new token")
-                token = token_hex(32)
-
-            if token:
-                backend.set_option("sentinel", "main", "device_token", token)
-
-            if modules is not None:
-                for module in SentinelUci._SENTINEL_MODULES:
-                    if modules.get(module):
-                        backend.add_section("sentinel", module, module)
-                        backend.set_option("sentinel", module, "enabled", store_bool(modules[module]["enabled"]))
-
-                protocols = modules["minipot"]["protocols"]
-                for protocol in SentinelUci._MINIPOT_PROTOCOLS:
-                    """The logic of protocols is following:
+    @staticmethod
+    def _diff(
+        config: SentinelConfig, options: typing.Dict[typing.Tuple[str, str], typing.Optional[str]]
+    ) -> typing.Dict[typing.Tuple[str, str], typing.Optional[str]]:
+        """ Filter out options which already have the requested value (None means unset) """
+        return {
+            key: value for key, value in options.items()
+            if config.get(*key, SentinelUci._DEFAULTS.get(key)) != value
+        }
+
+    @staticmethod
+    def _apply(
+        backend: UciBackend, config: SentinelConfig,
+        changes: typing.Dict[typing.Tuple[str, str], typing.Optional[str]]
+    ):
+        for section in sorted({section for section, _ in changes} - config.sections.keys()):
+            backend.add_section("sentinel", section, section)
+
+        for (section, option), value in changes.items():
+            if value is None:
+                backend.del_option("sentinel", section, option, fail_on_error=False)
+            else:
+                backend.set_option("sentinel", section, option, value)
+
+    @staticmethod
+    def _changed_components(
+        changes: typing.Dict[typing.Tuple[str, str], typing.Optional[str]]
+    ) -> typing.Optional[typing.Set[str]]:
+        """ Components which need to be reloaded, None means all of them """
+        res = set()
+        for section, option in changes:
+            key = (section, option) if (section, option) in SentinelUci._RELOADED_COMPONENTS else (section, None)
+            # unknown options reload everything
+            components = SentinelUci._RELOADED_COMPONENTS.get(key)
+            if components is None:
+                return None
+            res.update(components)
+        return res
+
+    @staticmethod
+    def _modules_options(
+        modules: dict
+    ) -> typing.Dict[str, typing.Tuple[typing.Tuple[str, str], typing.Optional[str]]]:
+        """ Options for modules settings as {"modules.<field>": ((section, option), value)} """
+        res = {}
+        for module in SentinelUci._SENTINEL_MODULES:
+            if modules.get(module):
+                res[f"modules.{module}.enabled"] = ((module, "enabled"), store_bool(modules[module]["enabled"]))
+
+        if not modules.get("minipot"):
+            return res
+
+        protocols = modules["minipot"]["protocols"]
+        for protocol in SentinelUci._MINIPOT_PROTOCOLS:
+            """The logic of protocols is following:
     - no entry means that service is activated,
     - number value is non-default port number
     - `0` is to disable the service """
-                    if protocols[protocol]:
-                        backend.del_option("sentinel", "minipot", f"{protocol}_port", fail_on_error=False)
-                    else:
-                        backend.set_option("sentinel", "minipot", f"{protocol}_port", "0")
+            res[f"modules.minipot.protocols.{protocol}"] = (
+                ("minipot", f"{protocol}_port"), None if protocols[protocol] else "0"
+            )
+        return res
+
+    @staticmethod
+    def _fakepot_options(
+        fakepot: dict
+    ) -> typing.Dict[str, typing.Tuple[typing.Tuple[str, str], typing.Optional[str]]]:
+        """ Options for fakepot settings as {"fakepot.<option>": ((section, option), value)} """
+        return {
+            "fakepot.enabled": (("fakepot", "enabled"), store_bool(fakepot["enabled"])),
+            "fakepot.extra_option": (("fakepot", "extra_option"), fakepot["extra_option"]),
+        }
+
+    @staticmethod
+    def _settings_options(
+        config: SentinelConfig, eula: int, modules: typing.Optional[dict] = None, token: typing.Optional[str] = None,
+    ) -> typing.Tuple[typing.Dict[typing.Tuple[str, str], typing.Optional[str]], typing.Optional[str]]:
+        """ Options for sentinel settings
+
+        :returns: (options, token) where token is a newly generated one if needed
+        """
+        # TODO check whether eula number matches current eula number
+        options = {("main", "agreed_with_eula_version"): str(eula)}
+
+        # update token
+        stored_token = config.get("main", "device_token", "") or None
+        if token is None and stored_token is None:
+            logger.debug("Generating new token")
+            token = token_hex(32)
+
+        if token:
+            options[("main", "device_token")] = token
+
+        if modules is not None:
+            options.update(SentinelUci._modules_options(modules).values())
+
+        return options, token
+
+    def _commit(
+        self, config: SentinelConfig, options: typing.Dict[typing.Tuple[str, str], typing.Optional[str]]
+    ) -> typing.Dict[typing.Tuple[str, str], typing.Optional[str]]:
+        """ Write options which differ from the config in one uci transaction and reload affected components
+
+        :returns: changed options
+        """
+        changes = self._diff(config, options)
+        if not changes:
+            return changes
+
+        with SentinelUci._write_lock:
+            with UciBackend() as backend:
+                self._apply(backend, config, changes)
+
+            self.invalidate_config()
+            if SentinelUci._baseline is not None:
+                SentinelUci._baseline = self.read_config()
+
+        components = self._changed_components(changes)
+        # fakepot options alone don't need any reload
+        if components != set():
+            self.reloader.schedule(components)
+
+        return changes
+
+    def update_settings(self, eula, modules=None, token=None):
+
+        if not SentinelEulas.is_valid(eula):
+            data = self.get_settings()
+            return False, data["eula"], None, []
+
+        config = self.read_config()
+        options, token = self._settings_options(config, eula, modules, token)
+        changes = self._commit(config, options)
+
+        # Update wizard step (even when nothing changed, the step was passed)
+        WebUciCommands.update_passed("sentinel")
+
+        return True, eula, token if eula != 0 else None, sorted(f"{s}.{o}" for s, o in changes)
+
+    def update_all_settings(self, settings: dict, fakepot: dict):
+        """ Update sentinel and fakepot settings in one uci transaction
+
+        :param settings: the same as arguments of update_settings
+        :param fakepot: {"enabled": True/False, "extra_option": "..."}
+        :returns: the same as update_settings
+        """
+        eula = settings["eula"]
+        if not SentinelEulas.is_valid(eula):
+            data = self.get_settings()
+            return False, data["eula"], None, []
+
+        config = self.read_config()
+        options, token = self._settings_options(config, eula, settings.get("modules"), settings.get("token"))
+        options.update(self._fakepot_options(fakepot).values())
+        changes = self._commit(config, options)
 
-        # Update wizard step
         WebUciCommands.update_passed("sentinel")
 
-        # Reload sentinel components
-        BaseCmdLine._run_command_and_check_retval(["/usr/bin/sentinel-reload"], 0)
+        return True, eula, token if eula != 0 else None, sorted(f"{s}.{o}" for s, o in changes)
+
+    def apply_profile(self, profile: dict) -> typing.Tuple[bool, typing.Dict[str, str]]:
+        """ Apply eula, modules and fakepot settings at once
+
+        All options are written in a single uci transaction and the affected
+        components are reloaded once. Nothing is written when the profile is
+        not valid.
+
+        :returns: (result, {"<field>": "changed"/"unchanged"/"invalid"})
+        """
+        if "eula" in profile and not SentinelEulas.is_valid(profile["eula"]):
+            return False, {"eula": "invalid"}
+
+        config = self.read_config()
+
+        fields = {}
+        if "eula" in profile:
+            fields["eula"] = (("main", "agreed_with_eula_version"), str(profile["eula"]))
+            # the same as in update_settings, token is generated once the eula is handled
+            if not config.get("main", "device_token", ""):
+                fields["token"] = (("main", "device_token"), token_hex(32))
+        if "modules" in profile:
+            fields.update(self._modules_options(profile["modules"]))
+        if "fakepot" in profile:
+            fields.update(self._fakepot_options(profile["fakepot"]))
+
+        changes = self._commit(config, dict(fields.values()))
+
+        if "eula" in profile:
+            WebUciCommands.update_passed("sentinel")
 
-        return True, eula, token if eula != 0 else None
+        return True, {field: "changed" if key in changes else "unchanged" for field, (key, _) in fields.items()}
 
-    def get_fakepot_settings(self) -> dict:
-        data = self._read_uci()
+    def get_fakepot_settings(self, config: typing.Optional[SentinelConfig] = None) -> dict:
+        config = config or self.read_config()
 
-        enabled = parse_bool(get_option_named(data, "sentinel", "fakepot", "enabled", "0"))
-        extra_option = get_option_named(data, "sentinel", "fakepot", "extra_option", "")
+        enabled = parse_bool(config.get("fakepot", "enabled", "0"))
+        extra_option = config.get("fakepot", "extra_option", "")
         return {"enabled": enabled, "extra_option": extra_option}
 
     def update_fakepot_settings(self, enabled, extra_option):
-        with UciBackend() as backend:
+        options = self._fakepot_options({"enabled": enabled, "extra_option": extra_option})
+        self._commit(self.read_config(), dict(options.values()))
+        return True
 
-            backend.add_section("sentinel", "fakepot", "fakepot")
-            backend.set_option("sentinel", "fakepot", "enabled", store_bool(enabled))
-            backend.set_option("sentinel", "fakepot", "extra_option", extra_option)
 
-        return True
+# "<component>: <STATE>" line of sentinel-status output
+_STATUS_LINE_RE = re.compile(rb"^([a-zA-Z ]+): ([a-zA-Z]+)$")
 
 
-class SentinelStatus(BaseCmdLine):
+def _status_lines(
+    components: typing.Dict[str, str], states: typing.Dict[str, str]
+) -> typing.Dict[bytes, typing.Tuple[str, str]]:
+    """ All expected lines of sentinel-status output mapped to (component, state) """
+    return {
+        f"{name}: {status}".encode(): (component, state)
+        for name, component in components.items() for status, state in states.items()
+    }
+
+
+class SentinelStatus:
     """ Class used for querying status of sentinel and it's components """
     _COMPONENTS = {
         "FWLogs": "fwlogs",
@@ -153,26 +608,264 @@ class SentinelStatus(BaseCmdLine):
         "SENDING": "sending",
         "UNKNOWN": "unknown",
     }
+    _LINES = _status_lines(_COMPONENTS, _STATES)
+    _COMPONENT_NAMES = {name.encode(): component for name, component in _COMPONENTS.items()}
+
+    # seconds between two state probes of the background monitor
+    INTERVAL = 10.0
+    # older samples are still returned, but a new probe is requested
+    MAX_AGE = 30.0
+    COMMAND = "/usr/bin/sentinel-status"
+    # seconds to wait for sentinel-status
+    TIMEOUT = 5.0
+    # sentinel-status is not called for RETRY_AFTER seconds after FAILURE_THRESHOLD failures in a row
+    FAILURE_THRESHOLD = 3
+    RETRY_AFTER = 60.0
+
+    def __init__(self):
+        super().__init__()
+        self.notify: typing.Optional[typing.Callable[[str, dict], None]] = None
+        self._condition = threading.Condition()
+        self._state: typing.Optional[typing.Dict[str, str]] = None
+        self._sampled_at: typing.Optional[float] = None
+        self._refresh_requested = False
+        # concurrent probes are merged into one
+        self._probe_done = threading.Condition()
+        self._probing = False
+        self.breaker = CircuitBreaker(self.FAILURE_THRESHOLD, self.RETRY_AFTER)
+        self._monitor: typing.Optional[threading.Thread] = None
+        # whether sentinel-status supports structured output, None until it's known
+        self._structured: typing.Optional[bool] = None
+        # sentinel-status which was probed, see _stat_key()
+        self._command_key: typing.Optional[tuple] = None
+        self.history = StateHistory(self._COMPONENTS.values(), list(self._STATES.values()) + ["uninstalled"])
 
     def get_state(self) -> typing.Dict[str, str]:
         """ Return state of sentinel components """
-        # fill in default values
-        state = {component: "uninstalled" for component in self._COMPONENTS.values()}
+        return self.get_state_sample()[0]
+
+    def start(self):
+        """ Start the background monitor (and sending of state_changed notifications) """
+        with self._condition:
+            if self._monitor is None:
+                # the first probe is not delayed by INTERVAL
+                self._refresh_requested = True
+                self._monitor = threading.Thread(target=self._run, name="sentinel-status", daemon=True)
+                self._monitor.start()
+
+    def get_state_sample(self) -> typing.Tuple[typing.Dict[str, str], float]:
+        """ Return state of sentinel components and age of the sample in seconds
+
+        State is periodically probed in background, so the last known state is
+        returned. Only the first call waits for sentinel-status (concurrent
+        first calls share the probe). When the sample is older than MAX_AGE,
+        it is returned anyway and a new probe is started in background.
+        """
+        self.start()
+        with self._condition:
+            state = self._state
+
+        if state is None:
+            self._probe_shared()
+
+        with self._condition:
+            if self._state is None:
+                # sentinel-status is not available and there is no known state
+                return {component: "unknown" for component in self._COMPONENTS.values()}, 0.0
+            state, age = self._state, time.monotonic() - self._sampled_at
+
+        if age > self.MAX_AGE:
+            self.refresh()
+
+        return dict(state), age
+
+    def get_state_history(
+        self, component: typing.Optional[str] = None, since: float = 0, until: typing.Optional[float] = None,
+        resolution: str = "raw",
+    ) -> dict:
+        """ Return recorded state transitions of sentinel components """
+        self.start()
+        return {
+            "resolution": resolution,
+            "history": self.history.get(component, since, until, resolution),
+        }
+
+    def refresh(self):
+        """ Request probing state of components as soon as possible """
+        with self._condition:
+            self._refresh_requested = True
+            self._condition.notify()
+
+    def _run(self):
+        while True:
+            with self._condition:
+                if not self._refresh_requested:
+                    self._condition.wait(self.INTERVAL)
+                self._refresh_requested = False
+
+            try:
+                self._probe_shared()
+            except Exception:
+                logger.exception("Failed to probe state of sentinel components")
+
+    def _probe_shared(self):
+        """ Probe state of components, callers which come during a probe wait for its result """
+        with self._probe_done:
+            if self._probing:
+                self._probe_done.wait_for(lambda: not self._probing)
+                if self._state is not None:
+                    return
+            # the previous probe failed or there was none
+            self._probing = True
 
         try:
-            out, _ = self._run_command_and_check_retval(["/usr/bin/sentinel-status"], 0)
-        except BackendCommandFailed:
+            state = self.probe()
+            # keep the last known state (and its age) when sentinel-status is not available
+            if state is not None:
+                self._update(state)
+        finally:
+            with self._probe_done:
+                self._probing = False
+                self._probe_done.notify_all()
+
+    def _update(self, state: typing.Dict[str, str]):
+        with self._condition:
+            previous, self._state = self._state, state
+            self._sampled_at = time.monotonic()
+
+        self.history.add(time.time(), state, previous)
+        if previous is not None and previous != state and self.notify:
+            self.notify("state_changed", dict(state))
+
+    def _status(self, args: typing.List[str]) -> typing.Optional[bytes]:
+        """ Output of sentinel-status, None means that it failed
+
+        :raises CommandTimeout: when sentinel-status doesn't finish in TIMEOUT seconds
+        """
+        try:
+            with metrics.measure("subprocess"):
+                retval, out, _ = run_command([self.COMMAND] + args, self.TIMEOUT)
+        except OSError:
+            logger.exception("Failed to run sentinel-status")
+            return None
+        return out if retval == 0 else None
+
+    def probe(self) -> typing.Optional[typing.Dict[str, str]]:
+        """ Query sentinel-status for state of sentinel components
+
+        :returns: state or None when sentinel-status timed out or it is not called
+                  because of previous failures
+        """
+        key = _stat_key([command_path(self.COMMAND)])
+        if key != self._command_key:
+            # sentinel-status was installed, replaced or removed, try it right away
+            self._command_key = key
+            self._structured = None
+            self.breaker.reset()
+
+        if not self.breaker.allow():
+            return None
+
+        try:
+            state = self._probe()
+        except CommandTimeout as e:
+            logger.warning("%s", e)
+            self.breaker.failure()
+            return None
+        except CommandFailed as e:
+            # sentinel-status is missing or broken, components are reported as uninstalled
+            logger.warning("%s", e)
+            self.breaker.failure()
+            return self.parse(None)
+
+        self.breaker.success()
+        return state
+
+    def _probe(self) -> typing.Dict[str, str]:
+        """ Probe state of components
+
+        :raises CommandFailed: when sentinel-status can't be run or it exits with an error
+        """
+        if self._structured is not False:
+            state = self.negotiate(self._status(["--json"]))
+            if state is not None:
+                return state
+
+        return self.parse_output(self._status([]))
+
+    def parse_output(self, out: typing.Optional[bytes]) -> typing.Dict[str, str]:
+        """ Parse plain output of sentinel-status
+
+        :raises CommandFailed: when sentinel-status failed (out is None)
+        """
+        if out is None:
+            raise CommandFailed("sentinel-status failed")
+        return self.parse(out)
+
+    def negotiate(self, out: typing.Optional[bytes]) -> typing.Optional[typing.Dict[str, str]]:
+        """ Handle output of `sentinel-status --json`
+
+        The first output decides whether the structured mode is used from now on.
+
+        :returns: state or None when the plain output needs to be parsed
+        """
+        state = self.parse_json(out)
+        if state is not None:
+            self._structured = True
             return state
 
-        lines = out.decode("utf8").strip().split("\n")
-        for line in lines:
-            match = re.match(r"^([a-zA-Z ]+): ([a-zA-Z]+)$", line)
-            if match:
-                component = match.group(1)
-                status = match.group(2)
+        if self._structured is None:
+            logger.debug("sentinel-status doesn't support structured output")
+            self._structured = False
+            if out is not None:
+                # the option was ignored and the plain output was printed
+                return self.parse(out)
+
+        return None
+
+    @classmethod
+    def _defaults(cls) -> typing.Dict[str, str]:
+        return {component: "uninstalled" for component in cls._COMPONENTS.values()}
 
-                if component in self._COMPONENTS:
-                    state[self._COMPONENTS[component]] = self._STATES.get(status, "unknown")
+    @classmethod
+    def parse_json(cls, out: typing.Optional[bytes]) -> typing.Optional[typing.Dict[str, str]]:
+        """ Parse structured output of sentinel-status ({"<component>": "<STATE>", ...})
+
+        :returns: state or None when the output is not structured
+        """
+        if out is None:
+            return None
+        try:
+            data = json.loads(out)
+        except ValueError:
+            return None
+        if not isinstance(data, dict):
+            return None
+
+        state = cls._defaults()
+        for name, status in data.items():
+            if name in cls._COMPONENTS:
+                known = isinstance(status, str) and status in cls._STATES
+                state[cls._COMPONENTS[name]] = cls._STATES[status] if known else "unknown"
+        return state
+
+    @classmethod
+    def parse(cls, out: typing.Optional[bytes]) -> typing.Dict[str, str]:
+        """ Parse output of sentinel-status, None means that it failed """
+        # fill in default values
+        state = cls._defaults()
+        if out is None:
+            return state
+
+        for line in out.strip().splitlines():
+            entry = cls._LINES.get(line)
+            if entry is None:
+                # known component in unexpected state or a malformed line
+                match = _STATUS_LINE_RE.match(line)
+                if not match or match.group(1) not in cls._COMPONENT_NAMES:
+                    continue
+                entry = (cls._COMPONENT_NAMES[match.group(1)], "unknown")
+            state[entry[0]] = entry[1]
 
         return state
 
@@ -180,14 +873,70 @@ class SentinelStatus(BaseCmdLine):
 _EULAS_LIST = typing.List[typing.Tuple[int, typing.Optional[str]]]
 
 
+class EulaCatalogue(typing.NamedTuple):
+    key: tuple
+    eulas: _EULAS_LIST
+    paths: typing.Dict[int, str]
+    versions: typing.FrozenSet[int]
+    latest: typing.Optional[int]
+
+
+_READ_BLOCK_SIZE = 16 * 1024
+
+
+@functools.lru_cache(maxsize=8)
+def _eula_etag(path: str, key: tuple) -> str:
+    """ Hash of the eula file, key is a part of cache key so modified files are hashed again """
+    checksum = hashlib.sha256()
+    with metrics.measure("eula_io"), open(inject_file_root(path), "rb") as f:
+        for block in iter(lambda: f.read(_READ_BLOCK_SIZE), b""):
+            checksum.update(block)
+    return checksum.hexdigest()
+
+
+@functools.lru_cache(maxsize=4)
+def _read_eula(path: str, key: tuple) -> str:
+    """ Read eula text, key is a part of cache key so modified files are read again """
+    with metrics.measure("eula_io"):
+        return BaseFile()._file_content(path)
+
+
+def _utf8_boundary(data: bytes) -> int:
+    """ Length of the longest prefix of data which doesn't end in the middle of a character """
+    for i in range(1, min(4, len(data)) + 1):
+        byte = data[-i]
+        if byte & 0xC0 == 0x80:  # continuation byte
+            continue
+        if byte < 0x80:
+            needed = 1
+        elif byte < 0xE0:
+            needed = 2
+        elif byte < 0xF0:
+            needed = 3
+        else:
+            needed = 4
+        return len(data) if needed <= i else len(data) - i
+    return len(data)
+
+
 class SentinelEulas:
     EULAS_PATH_PREFIX = "/usr/share/sentinel-eula"
+    # default size of a chunk (in bytes) when eula is read in chunks
+    CHUNK_SIZE = 8 * 1024
+
+    _catalogue: typing.Optional[EulaCatalogue] = None
 
     @staticmethod
-    def get_valid_eulas() -> _EULAS_LIST:
-        content = BaseFile()._file_content(
-            os.path.join(SentinelEulas.EULAS_PATH_PREFIX, "EULAs.csv")
-        )
+    def get_catalogue() -> EulaCatalogue:
+        """ Get parsed EULAs.csv, it is parsed again only when the file changes """
+        csv_path = os.path.join(SentinelEulas.EULAS_PATH_PREFIX, "EULAs.csv")
+        key = _stat_key([inject_file_root(csv_path)])
+        catalogue = SentinelEulas._catalogue
+        if catalogue is not None and catalogue.key == key:
+            return catalogue
+
+        with metrics.measure("eula_io"):
+            content = BaseFile()._file_content(csv_path)
 
         res = [(0, None)]
 
@@ -198,19 +947,88 @@ class SentinelEulas:
             except ValueError:
                 pass
 
-        return res
+        paths = dict(res[1:])
+        catalogue = EulaCatalogue(
+            key=key,
+            eulas=res,
+            paths=paths,
+            versions=frozenset(e[0] for e in res),
+            latest=max(paths.keys(), default=None),
+        )
+        SentinelEulas._catalogue = catalogue
+        return catalogue
+
+    @staticmethod
+    def get_valid_eulas() -> _EULAS_LIST:
+        return list(SentinelEulas.get_catalogue().eulas)
+
+    @staticmethod
+    def is_valid(version: int) -> bool:
+        return version in SentinelEulas.get_catalogue().versions
+
+    @staticmethod
+    def get_latest_eula_info() -> typing.Optional[dict]:
+        """ Version and etag of the latest eula (without its text), None when there is no eula """
+        catalogue = SentinelEulas.get_catalogue()
+        if catalogue.latest is None:
+            return None
+        path = os.path.join(SentinelEulas.EULAS_PATH_PREFIX, catalogue.paths[catalogue.latest])
+        return {"version": catalogue.latest, "etag": _eula_etag(path, _stat_key([inject_file_root(path)]))}
 
     @staticmethod
-    def get_eula(version: typing.Optional[int] = None) -> dict:
-        text = None
-        valid_eulas = dict(SentinelEulas.get_valid_eulas())
-        del valid_eulas[0]
+    def _read_chunk(path: str, offset: int, length: int) -> typing.Tuple[str, typing.Optional[int], int]:
+        """ Read part of eula file
+
+        :returns: (text, offset of the next chunk or None at the end, size of the file)
+        """
+        with metrics.measure("eula_io"), open(inject_file_root(path), "rb") as f:
+            size = os.fstat(f.fileno()).st_size
+            f.seek(offset)
+            data = f.read(length)
+
+        if offset + len(data) >= size:
+            return data.decode(errors="replace"), None, size
+
+        data = data[:_utf8_boundary(data)]
+        return data.decode(errors="replace"), offset + len(data), size
+
+    @staticmethod
+    def get_eula(
+        version: typing.Optional[int] = None, etag: typing.Optional[str] = None,
+        offset: typing.Optional[int] = None, length: typing.Optional[int] = None,
+    ) -> dict:
+        """ Get text of eula
+
+        When etag of the eula matches the etag known by the client,
+        the text is not sent again.
+
+        When offset or length is set, only a part of the text starting at offset
+        (in bytes) is read. The reply then contains offset of the next part.
+        """
+        catalogue = SentinelEulas.get_catalogue()
         if version is None:
-            version = max(e for e in valid_eulas.keys())
+            # 0 (eula disabled) when EULAs.csv lists no eula
+            version = catalogue.latest if catalogue.latest is not None else 0
 
-        if version in valid_eulas:
-            text = BaseFile()._file_content(
-                os.path.join(SentinelEulas.EULAS_PATH_PREFIX, valid_eulas[version])
-            )
+        if version not in catalogue.paths:
+            return {"version": version, "text": None}
+
+        path = os.path.join(SentinelEulas.EULAS_PATH_PREFIX, catalogue.paths[version])
+        key = _stat_key([inject_file_root(path)])
+        current_etag = _eula_etag(path, key)
+        if etag == current_etag:
+            return {"version": version, "etag": current_etag, "not_modified": True}
 
-        return {"version": version, "text": text}
+        if offset is None and length is None:
+            return {"version": version, "text": _read_eula(path, key), "etag": current_etag}
+
+        offset = offset or 0
+        text, next_offset, size = SentinelEulas._read_chunk(path, offset, length or SentinelEulas.CHUNK_SIZE)
+        return {
+            "version": version,
+            "text": text,
+            "etag": current_etag,
+            "offset": offset,
+            "next_offset": next_offset,
+            "size": size,
+        }
@@ -0,0 +1,105 @@
+#
+# foris-controller-sentinel-module
+# Copyright (C) 2025 CZ.NIC, z.s.p.o. (http://www.nic.cz/)
+#
+# This program is free software; you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation; either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program; if not, write to the Free Software Foundation,
+# Inc., 51 Franklin Street, Fifth Floor, Boston, MA 02110-1301  USA
+#
+
+import os
+import subprocess
+import threading
+import time
+import typing
+
+
+class CommandTimeout(Exception):
+    pass
+
+
+class CommandFailed(Exception):
+    pass
+
+
+def command_path(path: str) -> str:
+    """ Path of a command in the cmdline root (FORIS_CMDLINE_ROOT, it is set only in tests) """
+    root = os.environ.get("FORIS_CMDLINE_ROOT")
+    if not root:
+        return path
+    return os.path.join(root, path.lstrip("/"))
+
+
+def command_args(args: typing.List[str]) -> typing.List[str]:
+    """ Command line with the command looked up in the cmdline root """
+    return [command_path(args[0])] + list(args[1:])
+
+
+def run_command(args: typing.List[str], timeout: typing.Optional[float] = None) -> typing.Tuple[int, bytes, bytes]:
+    """ Run command and wait at most timeout seconds for it
+
+    :returns: (retval, stdout, stderr)
+    :raises CommandTimeout: when the command doesn't finish in time (it is killed)
+    """
+    args = command_args(args)
+    try:
+        process = subprocess.run(args, stdout=subprocess.PIPE, stderr=subprocess.PIPE, timeout=timeout)
+    except subprocess.TimeoutExpired:
+        raise CommandTimeout(f"{args[0]} timed out after {timeout}s")
+    return process.returncode, process.stdout, process.stderr
+
+
+class CircuitBreaker:
+    """ Stops calling a failing command for a while
+
+    After `threshold` failures in a row the breaker opens and calls are not
+    allowed for `retry_after` seconds. Then a single call is allowed again and
+    its result decides whether the breaker closes or stays open.
+    """
+
+    def __init__(self, threshold: int, retry_after: float):
+        self.threshold = threshold
+        self.retry_after = retry_after
+        self._lock = threading.Lock()
+        self._failures = 0
+        self._opened_at: typing.Optional[float] = None
+
+    @property
+    def is_open(self) -> bool:
+        with self._lock:
+            return self._opened_at is not None
+
+    def allow(self) -> bool:
+        with self._lock:
+            if self._opened_at is None:
+                return True
+            if time.monotonic() - self._opened_at < self.retry_after:
+                return False
+            # let one call through, the others wait for another period
+            self._opened_at = time.monotonic()
+            return True
+
+    def success(self):
+        with self._lock:
+            self._failures = 0
+            self._opened_at = None
+
+    def reset(self):
+        """ Forget previous failures (e.g. the command was replaced) """
+        self.success()
+
+    def failure(self):
+        with self._lock:
+            self._failures += 1
+            if self._failures >= self.threshold:
+                self._opened_at = time.monotonic()
@@ -0,0 +1,128 @@
+#
+# foris-controller-sentinel-module
+# Copyright (C) 2025 CZ.NIC, z.s.p.o. (http://www.nic.cz/)
+#
+# This program is free software; you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation; either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program; if not, write to the Free Software Foundation,
+# Inc., 51 Franklin Street, Fifth Floor, Boston, MA 02110-1301  USA
+#
+
+import threading
+import typing
+
+from array import array
+
+
+class _Ring:
+    """ Fixed-size circular buffer of rows stored in preallocated arrays """
+
+    def __init__(self, capacity: int, typecodes: str):
+        self.capacity = capacity
+        self.columns = [array(typecode, [0] * capacity) for typecode in typecodes]
+        self.size = 0
+        self.next = 0
+
+    def append(self, *row):
+        for column, value in zip(self.columns, row):
+            column[self.next] = value
+        self.next = (self.next + 1) % self.capacity
+        self.size = min(self.size + 1, self.capacity)
+
+    def last(self, column: int):
+        return self.columns[column][(self.next - 1) % self.capacity] if self.size else None
+
+    def update_last(self, column: int, value):
+        self.columns[column][(self.next - 1) % self.capacity] = value
+
+    def rows(self) -> typing.Iterator[tuple]:
+        start = (self.next - self.size) % self.capacity
+        for i in range(self.size):
+            index = (start + i) % self.capacity
+            yield tuple(column[index] for column in self.columns)
+
+
+class _ComponentHistory:
+    def __init__(self, raw: int, minutes: int, hours: int):
+        # timestamp, state
+        self.raw = _Ring(raw, "db")
+        # bucket start, number of transitions, last state
+        self.minutes = _Ring(minutes, "qHb")
+        self.hours = _Ring(hours, "qHb")
+
+    def add(self, timestamp: float, state: int):
+        self.raw.append(timestamp, state)
+        for ring, size in ((self.minutes, 60), (self.hours, 3600)):
+            bucket = int(timestamp) // size * size
+            if ring.last(0) == bucket:
+                ring.update_last(1, min(ring.last(1) + 1, 0xFFFF))
+                ring.update_last(2, state)
+            else:
+                ring.append(bucket, 1, state)
+
+
+class StateHistory:
+    """ History of state transitions of sentinel components
+
+    Each transition is stored in a raw ring buffer and counted in per-minute
+    and per-hour buckets (only buckets with a transition are stored). All
+    buffers are preallocated, so memory use doesn't grow with uptime.
+    """
+    RAW_CAPACITY = 256
+    MINUTE_CAPACITY = 180
+    HOUR_CAPACITY = 168
+
+    def __init__(self, components: typing.Iterable[str], states: typing.Iterable[str]):
+        self._states = list(states)
+        self._codes = {state: code for code, state in enumerate(self._states)}
+        self._lock = threading.Lock()
+        self._components = {
+            component: _ComponentHistory(self.RAW_CAPACITY, self.MINUTE_CAPACITY, self.HOUR_CAPACITY)
+            for component in components
+        }
+
+    def add(self, timestamp: float, state: typing.Dict[str, str], previous: typing.Optional[typing.Dict[str, str]]):
+        """ Record components which state differs from the previous one """
+        with self._lock:
+            for component, history in self._components.items():
+                if component in state and (previous is None or previous.get(component) != state[component]):
+                    history.add(timestamp, self._codes[state[component]])
+
+    def get(
+        self, component: typing.Optional[str] = None, since: float = 0, until: typing.Optional[float] = None,
+        resolution: str = "raw",
+    ) -> typing.Dict[str, list]:
+        """ Get history of components
+
+        :returns: {component: [[timestamp, state], ...]} for raw resolution
+                  {component: [[bucket_start, transitions, last_state], ...]} otherwise
+        """
+        with self._lock:
+            res = {}
+            for name, history in self._components.items():
+                if component is not None and name != component:
+                    continue
+
+                ring, size = {
+                    "raw": (history.raw, 0), "minute": (history.minutes, 60), "hour": (history.hours, 3600)
+                }[resolution]
+                rows = []
+                for row in ring.rows():
+                    # keep buckets which overlap with the range
+                    if row[0] + size < since or (until is not None and row[0] > until):
+                        continue
+                    if resolution == "raw":
+                        rows.append([row[0], self._states[row[1]]])
+                    else:
+                        rows.append([row[0], row[1], self._states[row[2]]])
+                res[name] = rows
+            return res
@@ -0,0 +1,138 @@
+#
+# foris-controller-sentinel-module
+# Copyright (C) 2025 CZ.NIC, z.s.p.o. (http://www.nic.cz/)
+#
+# This program is free software; you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation; either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program; if not, write to the Free Software Foundation,
+# Inc., 51 Franklin Street, Fifth Floor, Boston, MA 02110-1301  USA
+#
+
+import collections
+import logging
+import os
+import threading
+import time
+import typing
+
+from foris_controller_backends.files import inject_file_root
+
+logger = logging.getLogger(__name__)
+
+
+class SentinelStatistics:
+    """ Counters exported by sentinel components
+
+    Each component periodically writes its counters to a file in STATS_DIR
+    (named after the component) in "<counter>=<value>" format, e.g.:
+
+        ftp_connections=1234
+        http_connections=42
+
+    Counters are sampled every INTERVAL seconds. Differences between two
+    samples are kept in fixed-size ring buffers and sent as a "statistics"
+    notification.
+    """
+    STATS_DIR = "/var/run/sentinel-stats"
+    INTERVAL = 60.0
+    # number of samples kept per counter
+    CAPACITY = 60
+
+    def __init__(self):
+        self.notify: typing.Optional[typing.Callable[[str, dict], None]] = None
+        self._lock = threading.Lock()
+        self._totals: typing.Optional[typing.Dict[str, int]] = None
+        self._series: typing.Dict[str, typing.Deque[typing.Tuple[int, int]]] = {}
+        self._sampler: typing.Optional[threading.Thread] = None
+
+    @staticmethod
+    def _read_counters(path: str) -> typing.Iterator[typing.Tuple[str, int]]:
+        with open(path) as f:
+            for line in f:
+                name, sep, value = line.partition("=")
+                if not sep:
+                    continue
+                try:
+                    yield name.strip(), int(value)
+                except ValueError:
+                    pass
+
+    def read(self) -> typing.Dict[str, int]:
+        """ Read current values of all counters as {"<component>.<counter>": value} """
+        stats_dir = inject_file_root(self.STATS_DIR)
+        try:
+            components = sorted(os.listdir(stats_dir))
+        except OSError:
+            return {}
+
+        res = {}
+        for component in components:
+            try:
+                for name, value in self._read_counters(os.path.join(stats_dir, component)):
+                    res[f"{component}.{name}"] = value
+            except OSError:
+                logger.warning("Failed to read statistics of '%s'", component)
+        return res
+
+    def sample(self) -> typing.Dict[str, int]:
+        """ Read counters and store differences from the previous sample """
+        totals = self.read()
+        timestamp = int(time.time())
+
+        with self._lock:
+            previous, self._totals = self._totals, totals
+            if previous is None:
+                return {}
+
+            deltas = {}
+            for name, value in totals.items():
+                last = previous.get(name, 0)
+                # counter decreased => component was restarted
+                delta = value - last if value >= last else value
+                series = self._series.setdefault(name, collections.deque(maxlen=self.CAPACITY))
+                series.append((timestamp, delta))
+                if delta:
+                    deltas[name] = delta
+
+        if deltas and self.notify:
+            self.notify("statistics", {"timestamp": timestamp, "deltas": deltas})
+        return deltas
+
+    def _run(self):
+        while True:
+            try:
+                self.sample()
+            except Exception:
+                logger.exception("Failed to sample sentinel statistics")
+            time.sleep(self.INTERVAL)
+
+    def start(self):
+        """ Start periodic sampling (and sending of notifications) """
+        with self._lock:
+            if self._sampler is None:
+                self._sampler = threading.Thread(target=self._run, name="sentinel-statistics", daemon=True)
+                self._sampler.start()
+
+    def get_statistics(self) -> dict:
+        self.start()
+        with self._lock:
+            sampled = self._totals is not None
+
+        if not sampled:
+            self.sample()
+
+        with self._lock:
+            return {
+                "interval": self.INTERVAL,
+                "totals": dict(self._totals or {}),
+                "series": {name: [list(e) for e in series] for name, series in self._series.items()},
+            }
@@ -0,0 +1,137 @@
+#
+# foris-controller-sentinel-module
+# Copyright (C) 2025 CZ.NIC, z.s.p.o. (http://www.nic.cz/)
+#
+# This program is free software; you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation; either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program; if not, write to the Free Software Foundation,
+# Inc., 51 Franklin Street, Fifth Floor, Boston, MA 02110-1301  USA
+#
+
+import ctypes
+import ctypes.util
+import logging
+import os
+import struct
+import threading
+import time
+import typing
+
+logger = logging.getLogger(__name__)
+
+
+class _Inotify:
+    """ Minimal inotify binding which watches a directory """
+    IN_CLOSE_WRITE = 0x008
+    IN_MOVED_TO = 0x080
+    IN_CREATE = 0x100
+    IN_DELETE = 0x200
+    IN_DELETE_SELF = 0x400
+    IN_MOVE_SELF = 0x800
+    IN_IGNORED = 0x8000
+    _EVENT = struct.Struct("iIII")
+
+    def __init__(self, directory: str):
+        libc = ctypes.CDLL(ctypes.util.find_library("c"), use_errno=True)
+        self.fd = libc.inotify_init1(os.O_CLOEXEC)
+        if self.fd < 0:
+            raise OSError(ctypes.get_errno(), "inotify_init1 failed")
+        mask = (
+            self.IN_CLOSE_WRITE | self.IN_MOVED_TO | self.IN_CREATE | self.IN_DELETE
+            | self.IN_DELETE_SELF | self.IN_MOVE_SELF
+        )
+        if libc.inotify_add_watch(self.fd, directory.encode(), mask) < 0:
+            errno = ctypes.get_errno()
+            os.close(self.fd)
+            raise OSError(errno, f"inotify_add_watch failed for '{directory}'")
+
+    def read(self) -> typing.Tuple[typing.Set[str], bool]:
+        """ Wait for events
+
+        :returns: (names of affected files, whether the directory is no longer watched)
+        """
+        data = os.read(self.fd, 4096)
+        names = set()
+        gone = False
+        offset = 0
+        while offset + self._EVENT.size <= len(data):
+            _, mask, _, length = self._EVENT.unpack_from(data, offset)
+            offset += self._EVENT.size
+            names.add(data[offset:offset + length].rstrip(b"\0").decode(errors="replace"))
+            offset += length
+            gone = gone or bool(mask & (self.IN_DELETE_SELF | self.IN_MOVE_SELF | self.IN_IGNORED))
+        return names, gone
+
+    def close(self):
+        os.close(self.fd)
+
+
+class ConfigWatcher:
+    """ Calls on_change when a file is written, replaced or removed
+
+    inotify watches the directory of the file (uci replaces config files by
+    renaming), where it's not available the file is polled every POLL_INTERVAL
+    seconds instead.
+    """
+    POLL_INTERVAL = 2.0
+    # wait for related writes (e.g. a few uci commits in a row)
+    SETTLE = 0.2
+
+    def __init__(self, path: str, on_change: typing.Callable[[], None]):
+        self.path = path
+        self.on_change = on_change
+        self._thread: typing.Optional[threading.Thread] = None
+
+    def start(self):
+        try:
+            inotify = _Inotify(os.path.dirname(self.path))
+            target, args = self._watch, (inotify, )
+        except (OSError, AttributeError) as e:
+            logger.debug("inotify is not available (%s), polling '%s'", e, self.path)
+            target, args = self._poll, ()
+        self._thread = threading.Thread(target=target, args=args, name="sentinel-watcher", daemon=True)
+        self._thread.start()
+
+    def _changed(self):
+        try:
+            self.on_change()
+        except Exception:
+            logger.exception("Failed to handle change of '%s'", self.path)
+
+    def _watch(self, inotify: _Inotify):
+        name = os.path.basename(self.path)
+        while True:
+            names, gone = inotify.read()
+            if name in names or gone:
+                time.sleep(self.SETTLE)
+                self._changed()
+            if gone:
+                # the directory was removed or replaced
+                logger.debug("'%s' is not watched anymore, polling '%s'", os.path.dirname(self.path), self.path)
+                inotify.close()
+                return self._poll()
+
+    def _stat(self) -> typing.Optional[tuple]:
+        try:
+            stat = os.stat(self.path)
+        except OSError:
+            return None
+        return stat.st_mtime_ns, stat.st_ino, stat.st_size
+
+    def _poll(self):
+        last = self._stat()
+        while True:
+            time.sleep(self.POLL_INTERVAL)
+            current = self._stat()
+            if current != last:
+                last = current
+                self._changed()
@@ -18,34 +18,61 @@
 #
 
 import logging
+import typing
 
 from foris_controller.module_base import BaseModule
 from foris_controller.handler_base import wrap_required_functions
+from foris_controller_sentinel_module.metrics import metrics
+from foris_controller_sentinel_module.notifications import NotificationCoalescer
 
 
 class SentinelModule(BaseModule):
     logger = logging.getLogger(__name__)
 
+    # notifications of these actions sent within the window (in seconds)
+    # are coalesced and only the last one is sent, 0 disables it
+    COALESCE_WINDOW = 0.5
+    COALESCED_ACTIONS = ("update_settings", "update_fakepot_settings", "update_all_settings")
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self._coalescer = NotificationCoalescer(self._send, self.COALESCE_WINDOW)
+        # notifications which are sent from background tasks (e.g. reload)
+        self.handler.register_notify(self.notify)
+
+    def _send(self, action: str, data: typing.Optional[dict] = None):
+        with metrics.measure("notify"):
+            return super().notify(action, data)
+
+    def notify(self, action: str, data: typing.Optional[dict] = None):
+        if action in self.COALESCED_ACTIONS and self.COALESCE_WINDOW > 0:
+            self._coalescer.push(action, data)
+        else:
+            self._send(action, data)
+
     def action_get_settings(self, data: dict):
         """ Get configuration of sentinel
-        :param data: {}
-        :returns: {"eula": 0..X, "token": "..."/None}
+        :param data: {} or {"since_revision": "..."}
+        :returns: {"eula": 0..X, "token": "..."/None, "modules": {...}, "revision": "..."}
+                  or {"revision": "...", "unchanged": True} when nothing changed since the revision
+                  or {"revision": "...", "changes": {...}} with changed fields only
         """
-        return self.handler.get_settings()
+        return self.handler.get_settings(**data)
 
     def action_update_settings(self, data):
         """ Update configuration of sentinel
         :param data: {"eula": 0..X} or {"eula": 0..X, "token": "..."}
-        :returns: {"result": ..., "eula": 0..X, "token": "..."} or {"result": ..., "eula": 0..X}
+        :returns: {"result": ..., "eula": 0..X, "token": "...", "changes": [...]}
+                  or {"result": ..., "eula": 0..X, "changes": [...]}
         """
-        res, eula, token = self.handler.update_settings(**data)
+        res, eula, token, changes = self.handler.update_settings(**data)
         if res:
             self.notify("update_settings", {"eula": eula})
 
         if token:
-            return {"result": res, "eula": eula, "token": token}
+            return {"result": res, "eula": eula, "token": token, "changes": changes}
 
-        return {"result": res, "eula": eula}
+        return {"result": res, "eula": eula, "changes": changes}
 
     def action_get_fakepot_settings(self, data: dict):
         """ Get configuration of sentinel
@@ -64,17 +91,77 @@ class SentinelModule(BaseModule):
         self.notify("update_fakepot_settings", data)
         return {"result": res}
 
+    def action_update_all_settings(self, data: dict):
+        """ Update sentinel and fakepot settings at once
+        :param data: {"settings": {"eula": 0..X, ...}, "fakepot": {"enabled": True/False, "extra_option": "..."}}
+        :returns: the same as update_settings
+        """
+        res, eula, token, changes = self.handler.update_all_settings(data["settings"], data["fakepot"])
+        if res:
+            self.notify("update_all_settings", {"eula": eula, "fakepot": data["fakepot"]})
+
+        if token:
+            return {"result": res, "eula": eula, "token": token, "changes": changes}
+
+        return {"result": res, "eula": eula, "changes": changes}
+
+    def action_apply_profile(self, data: dict):
+        """ Apply sentinel profile (eula, modules and fakepot settings) at once
+        :param data: {"eula": 0..X, "modules": {...}, "fakepot": {...}} (all optional)
+        :returns: {"result": True/False, "fields": {"<field>": "changed"/"unchanged"/"invalid"}}
+        """
+        res, fields = self.handler.apply_profile(data)
+        if res:
+            changes = sorted(field for field, result in fields.items() if result == "changed")
+            self.notify("apply_profile", {"changes": changes})
+        return {"result": res, "fields": fields}
+
     def action_get_eula(self, data: dict):
-        """ Get configuration of sentinel
-        :param data: {} or {"version": X}
-        :returns: {"version": X, "text": "blahblah"}
+        """ Get eula text
+        :param data: {} or {"version": X} or {"version": X, "etag": "..."}
+                     optionally with {"offset": X, "length": X} to get only a part of the text
+        :returns: {"version": X, "text": "blahblah", "etag": "..."}
+                  or {"version": X, "etag": "...", "not_modified": True} when etag matches
+                  or {"version": X, "text": "blah", "etag": "...", "offset": X, "next_offset": X/None, "size": X}
         """
         return self.handler.get_eula(**data)
 
     def action_get_state(self, data: dict):
-        """ Get state of sentinel components """
+        """ Get state of sentinel components
+        :param data: {}
+        :returns: {"<component>": "<state>", ..., "age": seconds since the state was probed}
+        """
         return self.handler.get_state()
 
+    def action_get_all(self, data: dict):
+        """ Get settings, fakepot settings, components state and latest eula at once
+        :param data: {}
+        :returns: {"settings": {...}, "fakepot": {...}, "state": {...}, "eula": {"version": X, "etag": "..."}}
+        """
+        return self.handler.get_all()
+
+    def action_get_state_history(self, data: dict):
+        """ Get history of sentinel components state
+        :param data: {} or {"component": "...", "since": ts, "until": ts, "resolution": "raw"/"minute"/"hour"}
+        :returns: {"resolution": "...", "history": {"<component>": [[ts, "<state>"], ...]}}
+                  or {"resolution": "...", "history": {"<component>": [[bucket_ts, transitions, "<state>"], ...]}}
+        """
+        return self.handler.get_state_history(**data)
+
+    def action_get_statistics(self, data: dict):
+        """ Get counters of sentinel components
+        :param data: {}
+        :returns: {"interval": X, "totals": {"<component>.<counter>": X}, "series": {"<component>.<counter>": [[ts, delta], ...]}}
+        """
+        return self.handler.get_statistics()
+
+    def action_get_metrics(self, data: dict):
+        """ Get timing of individual stages of sentinel actions
+        :param data: {}
+        :returns: {"bounds_ms": [...], "stages": {"uci_read": {"count": X, ...}, ...}}
+        """
+        return self.handler.get_metrics()
+
 
 @wrap_required_functions(
     [
@@ -82,8 +169,15 @@ class SentinelModule(BaseModule):
         "update_settings",
         "get_fakepot_settings",
         "update_fakepot_settings",
+        "update_all_settings",
+        "apply_profile",
         "get_eula",
         "get_state",
+        "get_all",
+        "get_metrics",
+        "get_statistics",
+        "get_state_history",
+        "register_notify",
     ]
 )
 class Handler(object):
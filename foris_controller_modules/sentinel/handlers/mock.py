@@ -17,6 +17,7 @@
 # Inc., 51 Franklin Street, Fifth Floor, Boston, MA 02110-1301  USA
 #
 
+import hashlib
 import typing
 import logging
 
@@ -24,6 +25,8 @@ from secrets import token_hex
 
 from foris_controller.handler_base import BaseMockHandler
 from foris_controller.utils import logger_wrapper
+from foris_controller_sentinel_module.metrics import metrics
+from foris_controller_sentinel_module.revisions import SettingsRevisions, revision_of
 
 from .. import Handler
 
@@ -60,34 +63,53 @@ class MockSentinelHandler(Handler, BaseMockHandler):
         }
     }
 
-    @logger_wrapper(logger)
-    def get_settings(self) -> dict:
+    notify: typing.Optional[typing.Callable[[str, dict], None]] = None
+    revisions = SettingsRevisions()
+
+    def register_notify(self, notify: typing.Callable[[str, dict], None]):
+        MockSentinelHandler.notify = notify
+
+    @staticmethod
+    def _settings() -> dict:
         return {
             "eula": MockSentinelHandler.eula,
             "token": MockSentinelHandler.token,
             "modules": MockSentinelHandler.fake_modules
         }
 
+    @logger_wrapper(logger)
+    def get_settings(self, since_revision: typing.Optional[str] = None) -> dict:
+        settings = self._settings()
+        return MockSentinelHandler.revisions.reply(revision_of(settings), settings, since_revision)
+
     @logger_wrapper(logger)
     def update_settings(
         self, eula: int, token: typing.Optional[str] = None,
         modules: typing.Optional[typing.Dict[str,bool]] = None,
         protocols: typing.Optional[typing.Dict[str,bool]] = None
-    ) -> typing.Tuple[bool, int, typing.Optional[str]]:
+    ) -> typing.Tuple[bool, int, typing.Optional[str], typing.List[str]]:
         if eula not in MockSentinelHandler.valid_eulas:
-            return False, MockSentinelHandler.eula, None
+            return False, MockSentinelHandler.eula, None, []
 
+        changes = []
+        if MockSentinelHandler.eula != eula:
+            changes.append("main.agreed_with_eula_version")
         MockSentinelHandler.eula = eula
 
-        if eula == 0:
-            return True, eula, None
+        if eula != 0:
+            if token is None and MockSentinelHandler.token is None:
+                token = token_hex(32)
+            if token is not None and token != MockSentinelHandler.token:
+                changes.append("main.device_token")
+                MockSentinelHandler.token = token
 
-        if token is not None:
-            MockSentinelHandler.token = token
-        elif MockSentinelHandler.token is None:
-            MockSentinelHandler.token = token_hex(32)
+        if changes and MockSentinelHandler.notify:
+            MockSentinelHandler.notify("reload", {"result": True})
+
+        if eula == 0:
+            return True, eula, None, changes
 
-        return True, eula, MockSentinelHandler.token
+        return True, eula, MockSentinelHandler.token, changes
 
     @logger_wrapper(logger)
     def get_fakepot_settings(self) -> dict:
@@ -103,17 +125,130 @@ class MockSentinelHandler(Handler, BaseMockHandler):
         return True
 
     @logger_wrapper(logger)
-    def get_eula(self, version: typing.Optional[int] = None) -> dict:
+    def update_all_settings(
+        self, settings: dict, fakepot: dict
+    ) -> typing.Tuple[bool, int, typing.Optional[str], typing.List[str]]:
+        res, eula, token, changes = self.update_settings(**settings)
+        if not res:
+            return res, eula, token, changes
+
+        for option in ("enabled", "extra_option"):
+            attr = f"fakepot_{option}"
+            if getattr(MockSentinelHandler, attr) != fakepot[option]:
+                changes.append(f"fakepot.{option}")
+                setattr(MockSentinelHandler, attr, fakepot[option])
+
+        return res, eula, token, sorted(changes)
+
+    @logger_wrapper(logger)
+    def apply_profile(self, profile: dict) -> typing.Tuple[bool, typing.Dict[str, str]]:
+        if "eula" in profile and profile["eula"] not in MockSentinelHandler.valid_eulas:
+            return False, {"eula": "invalid"}
+
+        fields = {}
+
+        def _set(field: str, obj, key: str, value):
+            fields[field] = "unchanged" if obj[key] == value else "changed"
+            obj[key] = value
+
+        if "eula" in profile:
+            fields["eula"] = "unchanged" if MockSentinelHandler.eula == profile["eula"] else "changed"
+            MockSentinelHandler.eula = profile["eula"]
+            if MockSentinelHandler.token is None:
+                fields["token"] = "changed"
+                MockSentinelHandler.token = token_hex(32)
+
+        for module, settings in profile.get("modules", {}).items():
+            _set(f"modules.{module}.enabled", MockSentinelHandler.fake_modules[module], "enabled", settings["enabled"])
+            for protocol, enabled in settings.get("protocols", {}).items():
+                _set(
+                    f"modules.{module}.protocols.{protocol}",
+                    MockSentinelHandler.fake_modules[module]["protocols"], protocol, enabled,
+                )
+
+        if "fakepot" in profile:
+            for option in ("enabled", "extra_option"):
+                attr = f"fakepot_{option}"
+                value = profile["fakepot"][option]
+                fields[f"fakepot.{option}"] = "unchanged" if getattr(MockSentinelHandler, attr) == value else "changed"
+                setattr(MockSentinelHandler, attr, value)
+
+        # fakepot doesn't need a reload
+        reloaded = [f for f, result in fields.items() if result == "changed" and not f.startswith("fakepot.")]
+        if reloaded and MockSentinelHandler.notify:
+            MockSentinelHandler.notify("reload", {"result": True})
+
+        return True, fields
+
+    @logger_wrapper(logger)
+    def get_eula(
+        self, version: typing.Optional[int] = None, etag: typing.Optional[str] = None,
+        offset: typing.Optional[int] = None, length: typing.Optional[int] = None,
+    ) -> dict:
         version = version or max(MockSentinelHandler.eulas.keys())
 
-        return {"version": version, "text": MockSentinelHandler.eulas.get(version)}
+        text = MockSentinelHandler.eulas.get(version)
+        if text is None:
+            return {"version": version, "text": None}
+
+        current_etag = hashlib.sha256(text.encode()).hexdigest()
+        if etag == current_etag:
+            return {"version": version, "etag": current_etag, "not_modified": True}
+
+        if offset is None and length is None:
+            return {"version": version, "text": text, "etag": current_etag}
+
+        data = text.encode()
+        offset = offset or 0
+        end = offset + (length or 8 * 1024)
+        return {
+            "version": version,
+            "text": data[offset:end].decode(errors="replace"),
+            "etag": current_etag,
+            "offset": offset,
+            "next_offset": end if end < len(data) else None,
+            "size": len(data),
+        }
 
     @staticmethod
-    @logger_wrapper(logger)
-    def get_state() -> typing.Dict[str, str]:
+    def _state() -> dict:
         return {
             "fwlogs": "running",
             "survey": "running",
             "minipot": "running",
             "proxy": "running",
         }
+
+    @logger_wrapper(logger)
+    def get_state(self) -> dict:
+        return dict(self._state(), age=0)
+
+    @logger_wrapper(logger)
+    def get_all(self) -> dict:
+        eula = self.get_eula()
+        return {
+            "settings": self._settings(),
+            "fakepot": self.get_fakepot_settings(),
+            "eula": {"version": eula["version"], "etag": eula["etag"]},
+            "state": self._state(),
+        }
+
+    @logger_wrapper(logger)
+    def get_metrics(self) -> dict:
+        return metrics.get()
+
+    @logger_wrapper(logger)
+    def get_state_history(
+        self, component: typing.Optional[str] = None, since: float = 0, until: typing.Optional[float] = None,
+        resolution: str = "raw",
+    ) -> dict:
+        history = {name: [] for name in self._state() if component in (None, name)}
+        return {"resolution": resolution, "history": history}
+
+    @logger_wrapper(logger)
+    def get_statistics(self) -> dict:
+        return {
+            "interval": 60,
+            "totals": {"minipot.ftp_connections": 120, "minipot.http_connections": 45, "fwlogs.dropped_packets": 12},
+            "series": {"minipot.ftp_connections": [[1700000000, 20], [1700000060, 100]]},
+        }
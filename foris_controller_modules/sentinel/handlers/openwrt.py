@@ -17,50 +17,165 @@
 # Inc., 51 Franklin Street, Fifth Floor, Boston, MA 02110-1301  USA
 #
 
+import importlib
 import logging
+import threading
 import typing
 
+from concurrent.futures import ThreadPoolExecutor
+
 from foris_controller.handler_base import BaseOpenwrtHandler
 from foris_controller.utils import logger_wrapper
-
-from foris_controller_backends.sentinel import SentinelStatus, SentinelUci, SentinelEulas
+from foris_controller_sentinel_module.metrics import metrics
 
 from .. import Handler
 
 logger = logging.getLogger(__name__)
 
 
+class LazyBackend:
+    """ Backend object which is imported and created on first access
+
+    Backends pull in a lot of other modules, so they are not imported while
+    foris-controller loads modules (see register_notify). Setup function gets
+    the backend and the handler class which accessed it.
+    """
+
+    def __init__(
+        self, name: str, setup: typing.Optional[typing.Callable[[typing.Any, type], None]] = None,
+        module: str = "foris_controller_backends.sentinel",
+    ):
+        self.name = name
+        self.setup = setup
+        self.module = module
+        self._lock = threading.Lock()
+        self._backend = None
+
+    def __get__(self, instance, owner):
+        if self._backend is None:
+            with self._lock:
+                if self._backend is None:
+                    backend = getattr(importlib.import_module(self.module), self.name)()
+                    if self.setup:
+                        self.setup(backend, owner)
+                    self._backend = backend
+        return self._backend
+
+
+def _notify(action: str, data: dict):
+    if OpenwrtSentinelHandler.notify_function:
+        OpenwrtSentinelHandler.notify_function(action, data)
+
+
+def _setup_uci(uci, handler: type):
+    uci.reloader.notify = _notify
+    uci.reloader.on_reload = lambda: handler.status.refresh()
+    uci.notify = _notify
+    uci.watch()
+
+
+def _setup_status(status, handler: type):
+    status.notify = _notify
+    status.start()
+
+
+def _setup_statistics(statistics, handler: type):
+    statistics.notify = _notify
+    statistics.start()
+
+
 class OpenwrtSentinelHandler(Handler, BaseOpenwrtHandler):
 
-    uci = SentinelUci()
-    eulas = SentinelEulas()
-    status = SentinelStatus()
+    uci = LazyBackend("SentinelUci", _setup_uci)
+    eulas = LazyBackend("SentinelEulas")
+    status = LazyBackend("SentinelStatus", _setup_status)
+    statistics = LazyBackend("SentinelStatistics", _setup_statistics, "foris_controller_backends.sentinel.statistics")
+
+    notify_function: typing.Optional[typing.Callable[[str, dict], None]] = None
+
+    # used to query components state while reading the config
+    _executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="sentinel")
+
+    def register_notify(self, notify: typing.Callable[[str, dict], None]):
+        OpenwrtSentinelHandler.notify_function = notify
+        # state_changed and config_changed are sent even to clients which never
+        # sent a request, the backends are imported in background so the startup
+        # is not slowed down
+        self._executor.submit(self._start_backends)
+
+    def _start_backends(self):
+        """ Create backends which watch sentinel in background (config watcher, state monitor) """
+        try:
+            self.uci
+            self.status
+        except Exception:
+            logger.exception("Failed to start sentinel backends")
 
     @logger_wrapper(logger)
-    def get_settings(self) -> dict:
-        return OpenwrtSentinelHandler.uci.get_settings()
+    def get_settings(self, since_revision: typing.Optional[str] = None) -> dict:
+        return self.uci.get_settings_since(since_revision)
 
     @logger_wrapper(logger)
     def update_settings(
         self, eula: int, token: typing.Optional[str] = None,
         modules: typing.Optional[typing.Dict[str,typing.Union[bool,typing.Dict[str,bool]]]] = None
-    ) -> typing.Tuple[bool, int, typing.Optional[str]]:
-        return OpenwrtSentinelHandler.uci.update_settings(eula, modules, token)
+    ) -> typing.Tuple[bool, int, typing.Optional[str], typing.List[str]]:
+        return self.uci.update_settings(eula, modules, token)
 
     @logger_wrapper(logger)
     def get_fakepot_settings(self) -> dict:
-        return OpenwrtSentinelHandler.uci.get_fakepot_settings()
+        return self.uci.get_fakepot_settings()
 
     @logger_wrapper(logger)
     def update_fakepot_settings(self, enabled: bool, extra_option: str) -> bool:
-        return OpenwrtSentinelHandler.uci.update_fakepot_settings(enabled, extra_option)
+        return self.uci.update_fakepot_settings(enabled, extra_option)
+
+    @logger_wrapper(logger)
+    def update_all_settings(
+        self, settings: dict, fakepot: dict
+    ) -> typing.Tuple[bool, int, typing.Optional[str], typing.List[str]]:
+        return self.uci.update_all_settings(settings, fakepot)
+
+    @logger_wrapper(logger)
+    def apply_profile(self, profile: dict) -> typing.Tuple[bool, typing.Dict[str, str]]:
+        return self.uci.apply_profile(profile)
+
+    @logger_wrapper(logger)
+    def get_eula(
+        self, version: typing.Optional[int] = None, etag: typing.Optional[str] = None,
+        offset: typing.Optional[int] = None, length: typing.Optional[int] = None,
+    ) -> dict:
+        return self.eulas.get_eula(version, etag, offset, length)
+
+    @logger_wrapper(logger)
+    def get_state(self) -> dict:
+        """ Get state of sentinel components and age of the sample """
+        state, age = self.status.get_state_sample()
+        return dict(state, age=round(age, 3))
+
+    @logger_wrapper(logger)
+    def get_all(self) -> dict:
+        state = self._executor.submit(self.status.get_state)
+
+        config = self.uci.read_config()
+        return {
+            "settings": self.uci.get_settings(config),
+            "fakepot": self.uci.get_fakepot_settings(config),
+            "eula": self.eulas.get_latest_eula_info(),
+            "state": state.result(),
+        }
+
+    @logger_wrapper(logger)
+    def get_metrics(self) -> dict:
+        return metrics.get()
 
     @logger_wrapper(logger)
-    def get_eula(self, version: typing.Optional[int] = None) -> dict:
-        return OpenwrtSentinelHandler.eulas.get_eula(version)
+    def get_state_history(
+        self, component: typing.Optional[str] = None, since: float = 0, until: typing.Optional[float] = None,
+        resolution: str = "raw",
+    ) -> dict:
+        return self.status.get_state_history(component, since, until, resolution)
 
-    @staticmethod
     @logger_wrapper(logger)
-    def get_state() -> typing.Dict[str, str]:
-        """ Get state of sentinel components """
-        return OpenwrtSentinelHandler.status.get_state()
+    def get_statistics(self) -> dict:
+        return self.statistics.get_statistics()
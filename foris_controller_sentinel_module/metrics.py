@@ -0,0 +1,81 @@
+#
+# foris-controller-sentinel-module
+# Copyright (C) 2025 CZ.NIC, z.s.p.o. (http://www.nic.cz/)
+#
+# This program is free software; you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation; either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program; if not, write to the Free Software Foundation,
+# Inc., 51 Franklin Street, Fifth Floor, Boston, MA 02110-1301  USA
+#
+
+import bisect
+import contextlib
+import threading
+import time
+import typing
+
+# upper bounds of histogram buckets in milliseconds, the last bucket is unbounded
+BOUNDS = (1, 5, 10, 50, 100, 500, 1000, 5000)
+
+STAGES = ("uci_read", "package_lists", "subprocess", "eula_io", "notify")
+
+
+class Histogram:
+    def __init__(self):
+        self.count = 0
+        self.total = 0.0
+        self.max = 0.0
+        self.buckets = [0] * (len(BOUNDS) + 1)
+
+    def add(self, duration_ms: float):
+        self.count += 1
+        self.total += duration_ms
+        self.max = max(self.max, duration_ms)
+        self.buckets[bisect.bisect_left(BOUNDS, duration_ms)] += 1
+
+    def to_dict(self) -> dict:
+        return {
+            "count": self.count,
+            "total_ms": round(self.total, 3),
+            "max_ms": round(self.max, 3),
+            "buckets": list(self.buckets),
+        }
+
+
+class Metrics:
+    """ Timing of individual stages of sentinel actions """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._histograms = {stage: Histogram() for stage in STAGES}
+
+    def record(self, stage: str, duration_ms: float):
+        with self._lock:
+            self._histograms[stage].add(duration_ms)
+
+    @contextlib.contextmanager
+    def measure(self, stage: str) -> typing.Iterator[None]:
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.record(stage, (time.perf_counter() - start) * 1000)
+
+    def get(self) -> dict:
+        with self._lock:
+            return {
+                "bounds_ms": list(BOUNDS),
+                "stages": {stage: histogram.to_dict() for stage, histogram in self._histograms.items()},
+            }
+
+
+metrics = Metrics()
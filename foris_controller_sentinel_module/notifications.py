@@ -0,0 +1,75 @@
+#
+# foris-controller-sentinel-module
+# Copyright (C) 2025 CZ.NIC, z.s.p.o. (http://www.nic.cz/)
+#
+# This program is free software; you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation; either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program; if not, write to the Free Software Foundation,
+# Inc., 51 Franklin Street, Fifth Floor, Boston, MA 02110-1301  USA
+#
+
+import logging
+import threading
+import time
+import typing
+
+logger = logging.getLogger(__name__)
+
+
+class NotificationCoalescer:
+    """ Coalesces notifications per action
+
+    The first notification of an action opens a window of `window` seconds.
+    Notifications of the same action which arrive within the window replace
+    the pending one and only the last one is sent when the window closes.
+    """
+
+    def __init__(self, send: typing.Callable[[str, typing.Optional[dict]], None], window: float):
+        self.send = send
+        self.window = window
+        self._cond = threading.Condition()
+        # action => (deadline, data)
+        self._pending: typing.Dict[str, typing.Tuple[float, typing.Optional[dict]]] = {}
+        self._worker: typing.Optional[threading.Thread] = None
+
+    def push(self, action: str, data: typing.Optional[dict] = None):
+        with self._cond:
+            if action in self._pending:
+                deadline = self._pending[action][0]
+            else:
+                deadline = time.monotonic() + self.window
+            self._pending[action] = (deadline, data)
+
+            if self._worker is None:
+                self._worker = threading.Thread(target=self._run, name="sentinel-notifications", daemon=True)
+                self._worker.start()
+            self._cond.notify()
+
+    def _due(self) -> typing.List[typing.Tuple[str, typing.Optional[dict]]]:
+        with self._cond:
+            while True:
+                now = time.monotonic()
+                due = [action for action, (deadline, _) in self._pending.items() if deadline <= now]
+                if due:
+                    return [(action, self._pending.pop(action)[1]) for action in due]
+                if self._pending:
+                    self._cond.wait(min(deadline for deadline, _ in self._pending.values()) - now)
+                else:
+                    self._cond.wait()
+
+    def _run(self):
+        while True:
+            for action, data in self._due():
+                try:
+                    self.send(action, data)
+                except Exception:
+                    logger.exception("Failed to send '%s' notification", action)
@@ -0,0 +1,91 @@
+#
+# foris-controller-sentinel-module
+# Copyright (C) 2025 CZ.NIC, z.s.p.o. (http://www.nic.cz/)
+#
+# This program is free software; you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation; either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program; if not, write to the Free Software Foundation,
+# Inc., 51 Franklin Street, Fifth Floor, Boston, MA 02110-1301  USA
+#
+
+import collections
+import copy
+import hashlib
+import json
+import threading
+import typing
+
+
+def revision_of(*parts) -> str:
+    """ Short content hash of JSON serializable parts """
+    checksum = hashlib.sha256()
+    for part in parts:
+        checksum.update(json.dumps(part, sort_keys=True).encode())
+        checksum.update(b"\0")
+    return checksum.hexdigest()[:16]
+
+
+def delta(old: dict, new: dict) -> typing.Optional[dict]:
+    """ Fields of new which differ from old, nested objects are compared recursively
+
+    :returns: changed fields or None when a field was removed
+    """
+    if old.keys() - new.keys():
+        return None
+
+    res = {}
+    for key, value in new.items():
+        previous = old.get(key)
+        if isinstance(value, dict) and isinstance(previous, dict):
+            changed = delta(previous, value)
+            if changed is None:
+                return None
+            if changed:
+                res[key] = changed
+        elif key not in old or previous != value:
+            res[key] = value
+    return res
+
+
+class SettingsRevisions:
+    """ Recently returned settings indexed by their revision
+
+    Clients which send the revision they already have get only the fields
+    which changed since then.
+    """
+    CAPACITY = 16
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._settings: typing.OrderedDict[str, dict] = collections.OrderedDict()
+
+    def reply(self, revision: str, settings: dict, since_revision: typing.Optional[str] = None) -> dict:
+        """
+        :returns: {"revision": "...", "unchanged": True} when nothing changed since the revision
+                  or {"revision": "...", "changes": {...}} with changed fields only
+                  or the whole settings with "revision" when the revision is not known
+        """
+        if since_revision == revision:
+            return {"revision": revision, "unchanged": True}
+
+        with self._lock:
+            if revision not in self._settings:
+                self._settings[revision] = copy.deepcopy(settings)
+            self._settings.move_to_end(revision)
+            while len(self._settings) > self.CAPACITY:
+                self._settings.popitem(last=False)
+            previous = self._settings.get(since_revision) if since_revision is not None else None
+
+        changes = delta(previous, settings) if previous is not None else None
+        if changes is None:
+            return dict(settings, revision=revision)
+        return {"revision": revision, "changes": changes}
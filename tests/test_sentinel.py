@@ -17,8 +17,10 @@
 # Inc., 51 Franklin Street, Fifth Floor, Boston, MA 02110-1301  USA
 #
 
+import hashlib
 import pytest
 import textwrap
+import time
 
 from .conftest import CMDLINE_SCRIPT_ROOT
 
@@ -59,6 +61,25 @@ def sentinel_status_malformed_data(request):
         yield f
 
 
+def etag(text):
+    return hashlib.sha256(text.encode()).hexdigest()
+
+
+def get_state_when(infrastructure, predicate, timeout=30.0):
+    """ State is probed in background, wait until the reported state matches """
+    end = time.monotonic() + timeout
+    while True:
+        res = infrastructure.process_message(
+            {"module": "sentinel", "action": "get_state", "kind": "request"}
+        )
+        if "error" in res or time.monotonic() > end:
+            return res
+        # sample age is not a component
+        if predicate({k: v for k, v in res["data"].items() if k != "age"}):
+            return res
+        time.sleep(0.5)
+
+
 @pytest.mark.parametrize('device,turris_os_version', [("mox", "4.0")], indirect=True)
 def test_get_settings(updater_userlists, updater_languages, file_root_init, infrastructure, uci_configs_init, device, turris_os_version):
     res = infrastructure.process_message(
@@ -72,6 +93,40 @@ def test_get_settings(updater_userlists, updater_languages, file_root_init, infr
     assert {"ftp", "http", "smtp", "telnet"} == res["data"]["modules"]["minipot"]["protocols"].keys()
 
 
+def test_get_settings_revision(
+    updater_userlists, updater_languages, file_root_init, infrastructure, init_script_result, uci_configs_init
+):
+    res = infrastructure.process_message(
+        {"module": "sentinel", "action": "get_settings", "kind": "request"}
+    )
+    revision = res["data"]["revision"]
+    eula = 2 if res["data"]["eula"] == 1 else 1
+
+    res = infrastructure.process_message(
+        {"module": "sentinel", "action": "get_settings", "kind": "request", "data": {"since_revision": revision}}
+    )
+    assert res["data"] == {"revision": revision, "unchanged": True}
+
+    res = infrastructure.process_message(
+        {"module": "sentinel", "action": "update_settings", "kind": "request", "data": {"eula": eula}}
+    )
+    assert res["data"]["result"] is True
+
+    res = infrastructure.process_message(
+        {"module": "sentinel", "action": "get_settings", "kind": "request", "data": {"since_revision": revision}}
+    )
+    assert res["data"]["revision"] != revision
+    assert res["data"]["changes"]["eula"] == eula
+    assert "modules" not in res["data"]["changes"]
+
+    # unknown revision => whole settings
+    res = infrastructure.process_message(
+        {"module": "sentinel", "action": "get_settings", "kind": "request", "data": {"since_revision": "0" * 16}}
+    )
+    assert res["data"]["eula"] == eula
+    assert "modules" in res["data"]
+
+
 def test_update_settings(
     file_root_init, infrastructure, init_script_result, uci_configs_init, updater_userlists, updater_languages
 ):
@@ -142,11 +197,15 @@ def test_update_settings_openwrt(
     updater_userlists, updater_languages, file_root_init, infrastructure, init_script_result, uci_configs_init
 ):
     uci = get_uci_module(infrastructure.name)
+    filters = [("sentinel", "reload")]
 
     # once eula is set to be < 0 a token should be generated
+    notifications = infrastructure.get_notifications(filters=filters)
     res = infrastructure.process_message(
         {"module": "sentinel", "action": "update_settings", "kind": "request", "data": {"eula": 1}}
     )
+    # reload is performed in background
+    notifications = infrastructure.get_notifications(notifications, filters=filters)
     assert command_was_called(["sentinel-reload"])
 
     res = infrastructure.process_message(
@@ -169,6 +228,7 @@ def test_update_settings_openwrt(
             "data": {"eula": 2, "token": token},
         }
     )
+    notifications = infrastructure.get_notifications(notifications, filters=filters)
     assert command_was_called(["sentinel-reload"])
 
     with uci.UciBackend(UCI_CONFIG_DIR_PATH) as uci_backend:
@@ -177,6 +237,77 @@ def test_update_settings_openwrt(
     assert uci.get_option_named(data, "sentinel", "main", "device_token") == token
 
 
+def test_update_settings_reload(
+    updater_userlists, updater_languages, file_root_init, infrastructure, init_script_result, uci_configs_init
+):
+    filters = [("sentinel", "reload")]
+
+    notifications = infrastructure.get_notifications(filters=filters)
+    res = infrastructure.process_message(
+        {"module": "sentinel", "action": "update_settings", "kind": "request", "data": {"eula": 1}}
+    )
+    assert res["data"]["result"] is True
+
+    notifications = infrastructure.get_notifications(notifications, filters=filters)
+    assert notifications[-1] == {
+        "module": "sentinel",
+        "action": "reload",
+        "kind": "notification",
+        "data": {"result": True},
+    }
+
+
+@pytest.mark.only_backends(["openwrt"])
+def test_update_settings_changes_openwrt(
+    updater_userlists, updater_languages, file_root_init, infrastructure, init_script_result, uci_configs_init
+):
+    filters = [("sentinel", "reload")]
+
+    notifications = infrastructure.get_notifications(filters=filters)
+    res = infrastructure.process_message(
+        {"module": "sentinel", "action": "update_settings", "kind": "request", "data": {"eula": 1}}
+    )
+    assert res["data"]["changes"] == ["main.agreed_with_eula_version", "main.device_token"]
+    notifications = infrastructure.get_notifications(notifications, filters=filters)
+    assert notifications[-1]["data"] == {"result": True}
+
+    # nothing changed
+    res = infrastructure.process_message(
+        {"module": "sentinel", "action": "update_settings", "kind": "request", "data": {"eula": 1}}
+    )
+    assert res["data"]["changes"] == []
+
+    # only proxy is reloaded
+    res = infrastructure.process_message(
+        {"module": "sentinel", "action": "update_settings", "kind": "request", "data": {"eula": 1, "token": "c" * 64}}
+    )
+    assert res["data"]["changes"] == ["main.device_token"]
+    notifications = infrastructure.get_notifications(notifications, filters=filters)
+    assert notifications[-1]["data"] == {"result": True, "components": ["proxy"]}
+    assert command_was_called(["sentinel-proxy"])
+
+    # modules affect firewall rules too, so the firewall is reloaded as well
+    modules = {
+        "minipot": {"enabled": True, "protocols": {"ftp": True, "http": True, "smtp": True, "telnet": False}},
+        "fwlogs": {"enabled": True},
+        "survey": {"enabled": False},
+    }
+    res = infrastructure.process_message(
+        {
+            "module": "sentinel",
+            "action": "update_settings",
+            "kind": "request",
+            "data": {"eula": 1, "modules": modules, "token": "d" * 64},
+        }
+    )
+    assert res["data"]["changes"] == ["main.device_token", "minipot.telnet_port", "survey.enabled"]
+    notifications = infrastructure.get_notifications(notifications, filters=filters)
+    assert notifications[-1]["data"] == {"result": True, "components": ["firewall", "minipot", "proxy", "survey"]}
+    assert command_was_called(["sentinel-minipot"])
+    assert command_was_called(["sentinel-survey"])
+    assert command_was_called(["firewall"])
+
+
 def test_get_fakepot_settings(file_root_init, infrastructure, uci_configs_init):
     res = infrastructure.process_message(
         {"module": "sentinel", "action": "get_fakepot_settings", "kind": "request"}
@@ -237,6 +368,187 @@ def test_update_fakepot_settings_openwrt(
     assert uci.get_option_named(data, "sentinel", "fakepot", "extra_option") == "second"
 
 
+def test_update_all_settings(
+    updater_userlists, updater_languages, file_root_init, infrastructure, init_script_result, uci_configs_init
+):
+    filters = [
+        ("sentinel", "update_all_settings"), ("sentinel", "update_settings"), ("sentinel", "update_fakepot_settings")
+    ]
+
+    old_notifications = infrastructure.get_notifications(filters=filters)
+    res = infrastructure.process_message(
+        {
+            "module": "sentinel",
+            "action": "update_all_settings",
+            "kind": "request",
+            "data": {"settings": {"eula": 1}, "fakepot": {"enabled": True, "extra_option": "all"}},
+        }
+    )
+    assert res["data"]["result"] is True
+    assert "fakepot.extra_option" in res["data"]["changes"]
+
+    # a single combined notification
+    notifications = infrastructure.get_notifications(old_notifications, filters=filters)
+    assert [e["action"] for e in notifications[len(old_notifications):]] == ["update_all_settings"]
+    assert notifications[-1] == {
+        "module": "sentinel",
+        "action": "update_all_settings",
+        "kind": "notification",
+        "data": {"eula": 1, "fakepot": {"enabled": True, "extra_option": "all"}},
+    }
+
+    res = infrastructure.process_message(
+        {"module": "sentinel", "action": "get_fakepot_settings", "kind": "request"}
+    )
+    assert res["data"] == {"enabled": True, "extra_option": "all"}
+
+
+PROFILE = {
+    "eula": 1,
+    "modules": {
+        "minipot": {"enabled": True, "protocols": {"ftp": True, "http": True, "smtp": False, "telnet": True}},
+        "fwlogs": {"enabled": True},
+        "survey": {"enabled": False},
+    },
+    "fakepot": {"enabled": True, "extra_option": "profile"},
+}
+
+
+def test_apply_profile(
+    updater_userlists, updater_languages, file_root_init, infrastructure, init_script_result, uci_configs_init
+):
+    filters = [("sentinel", "apply_profile")]
+
+    notifications = infrastructure.get_notifications(filters=filters)
+    res = infrastructure.process_message(
+        {"module": "sentinel", "action": "apply_profile", "kind": "request", "data": PROFILE}
+    )
+    assert res["data"]["result"] is True
+    assert res["data"]["fields"]["fakepot.extra_option"] == "changed"
+    assert res["data"]["fields"]["modules.survey.enabled"] == "changed"
+    assert set(res["data"]["fields"].values()) <= {"changed", "unchanged"}
+
+    notifications = infrastructure.get_notifications(notifications, filters=filters)
+    assert "fakepot.extra_option" in notifications[-1]["data"]["changes"]
+
+    res = infrastructure.process_message(
+        {"module": "sentinel", "action": "get_settings", "kind": "request"}
+    )
+    assert res["data"]["eula"] == 1
+    assert res["data"]["modules"]["survey"]["enabled"] is False
+    assert res["data"]["modules"]["minipot"]["protocols"]["smtp"] is False
+
+    res = infrastructure.process_message(
+        {"module": "sentinel", "action": "get_fakepot_settings", "kind": "request"}
+    )
+    assert res["data"] == {"enabled": True, "extra_option": "profile"}
+
+    # the second time nothing changes
+    res = infrastructure.process_message(
+        {"module": "sentinel", "action": "apply_profile", "kind": "request", "data": PROFILE}
+    )
+    assert res["data"]["result"] is True
+    assert set(res["data"]["fields"].values()) == {"unchanged"}
+
+
+def test_apply_profile_invalid_eula(
+    updater_userlists, updater_languages, file_root_init, infrastructure, init_script_result, uci_configs_init
+):
+    profile = dict(PROFILE, eula=999, fakepot={"enabled": True, "extra_option": "invalid"})
+    res = infrastructure.process_message(
+        {"module": "sentinel", "action": "apply_profile", "kind": "request", "data": profile}
+    )
+    assert res["data"] == {"result": False, "fields": {"eula": "invalid"}}
+
+    # nothing was written
+    res = infrastructure.process_message(
+        {"module": "sentinel", "action": "get_fakepot_settings", "kind": "request"}
+    )
+    assert res["data"]["extra_option"] != "invalid"
+
+
+def test_apply_profile_partial_modules(
+    updater_userlists, updater_languages, file_root_init, infrastructure, init_script_result, uci_configs_init
+):
+    res = infrastructure.process_message(
+        {
+            "module": "sentinel",
+            "action": "apply_profile",
+            "kind": "request",
+            "data": {"modules": {"survey": {"enabled": True}}},
+        }
+    )
+    assert res["data"]["result"] is True
+    assert set(res["data"]["fields"]) == {"modules.survey.enabled"}
+
+    res = infrastructure.process_message(
+        {"module": "sentinel", "action": "get_settings", "kind": "request"}
+    )
+    assert res["data"]["modules"]["survey"]["enabled"] is True
+
+
+@pytest.mark.only_backends(["openwrt"])
+def test_apply_profile_openwrt(
+    updater_userlists, updater_languages, file_root_init, infrastructure, init_script_result, uci_configs_init
+):
+    filters = [("sentinel", "reload")]
+    uci = get_uci_module(infrastructure.name)
+
+    notifications = infrastructure.get_notifications(filters=filters)
+    res = infrastructure.process_message(
+        {"module": "sentinel", "action": "apply_profile", "kind": "request", "data": PROFILE}
+    )
+    assert res["data"]["result"] is True
+
+    # eula change reloads everything at once
+    notifications = infrastructure.get_notifications(notifications, filters=filters)
+    assert notifications[-1]["data"] == {"result": True}
+
+    with uci.UciBackend(UCI_CONFIG_DIR_PATH) as uci_backend:
+        data = uci_backend.read()
+    assert int(uci.get_option_named(data, "sentinel", "main", "agreed_with_eula_version")) == 1
+    assert not uci.parse_bool(uci.get_option_named(data, "sentinel", "survey", "enabled"))
+    assert uci.get_option_named(data, "sentinel", "minipot", "smtp_port") == "0"
+    assert uci.parse_bool(uci.get_option_named(data, "sentinel", "fakepot", "enabled"))
+    assert uci.get_option_named(data, "sentinel", "fakepot", "extra_option") == "profile"
+
+    # fakepot alone is not reloaded
+    res = infrastructure.process_message(
+        {
+            "module": "sentinel",
+            "action": "apply_profile",
+            "kind": "request",
+            "data": {"fakepot": {"enabled": False, "extra_option": ""}},
+        }
+    )
+    assert res["data"]["fields"] == {"fakepot.enabled": "changed", "fakepot.extra_option": "changed"}
+
+
+@pytest.mark.only_backends(["openwrt"])
+def test_external_config_change(
+    updater_userlists, updater_languages, file_root_init, infrastructure, init_script_result, uci_configs_init
+):
+    filters = [("sentinel", "config_changed")]
+    uci = get_uci_module(infrastructure.name)
+
+    # config is watched since the module is registered, no uci request is needed
+    notifications = infrastructure.get_notifications(filters=filters)
+
+    with uci.UciBackend(UCI_CONFIG_DIR_PATH) as uci_backend:
+        uci_backend.add_section("sentinel", "fakepot", "fakepot")
+        uci_backend.set_option("sentinel", "fakepot", "extra_option", "external")
+
+    notifications = infrastructure.get_notifications(notifications, filters=filters)
+    assert notifications[-1]["action"] == "config_changed"
+    assert notifications[-1]["data"]["changes"] == ["fakepot.extra_option"]
+    assert notifications[-1]["data"]["sections"] == ["fakepot"]
+
+    res = infrastructure.process_message(
+        {"module": "sentinel", "action": "get_fakepot_settings", "kind": "request"}
+    )
+    assert res["data"]["extra_option"] == "external"
+
+
 def test_update_settings_invalid_eula(
     updater_userlists, updater_languages, file_root_init, infrastructure, init_script_result, uci_configs_init
 ):
@@ -268,19 +580,19 @@ def test_get_eula(file_root_init, infrastructure, uci_configs_init):
         {"module": "sentinel", "action": "get_eula", "kind": "request"}
     )
     assert "data" in res
-    assert res["data"] == {"version": 2, "text": "Second version\n"}
+    assert res["data"] == {"version": 2, "text": "Second version\n", "etag": etag("Second version\n")}
 
     res = infrastructure.process_message(
         {"module": "sentinel", "action": "get_eula", "kind": "request", "data": {"version": 2}}
     )
     assert "data" in res
-    assert res["data"] == {"version": 2, "text": "Second version\n"}
+    assert res["data"] == {"version": 2, "text": "Second version\n", "etag": etag("Second version\n")}
 
     res = infrastructure.process_message(
         {"module": "sentinel", "action": "get_eula", "kind": "request", "data": {"version": 1}}
     )
     assert "data" in res
-    assert res["data"] == {"version": 1, "text": "First version\n"}
+    assert res["data"] == {"version": 1, "text": "First version\n", "etag": etag("First version\n")}
 
     res = infrastructure.process_message(
         {"module": "sentinel", "action": "get_eula", "kind": "request", "data": {"version": 99}}
@@ -289,6 +601,96 @@ def test_get_eula(file_root_init, infrastructure, uci_configs_init):
     assert res["data"] == {"version": 99, "text": None}
 
 
+def test_get_eula_not_modified(file_root_init, infrastructure, uci_configs_init):
+    res = infrastructure.process_message(
+        {"module": "sentinel", "action": "get_eula", "kind": "request", "data": {"etag": etag("Second version\n")}}
+    )
+    assert res["data"] == {"version": 2, "etag": etag("Second version\n"), "not_modified": True}
+
+    res = infrastructure.process_message(
+        {
+            "module": "sentinel",
+            "action": "get_eula",
+            "kind": "request",
+            "data": {"version": 1, "etag": etag("Second version\n")},
+        }
+    )
+    assert res["data"] == {"version": 1, "text": "First version\n", "etag": etag("First version\n")}
+
+
+def test_get_all(updater_userlists, updater_languages, file_root_init, infrastructure, uci_configs_init):
+    res = infrastructure.process_message(
+        {"module": "sentinel", "action": "get_all", "kind": "request"}
+    )
+    assert "error" not in res
+    assert {"settings", "fakepot", "state", "eula"} == res["data"].keys()
+    assert res["data"]["eula"] == {"version": 2, "etag": etag("Second version\n")}
+
+    settings = infrastructure.process_message(
+        {"module": "sentinel", "action": "get_settings", "kind": "request"}
+    )
+    assert res["data"]["settings"] == settings["data"]
+
+    fakepot = infrastructure.process_message(
+        {"module": "sentinel", "action": "get_fakepot_settings", "kind": "request"}
+    )
+    assert res["data"]["fakepot"] == fakepot["data"]
+
+
+def test_get_state_history(file_root_init, infrastructure):
+    res = infrastructure.process_message(
+        {"module": "sentinel", "action": "get_state_history", "kind": "request", "data": {"resolution": "hour"}}
+    )
+    assert "error" not in res
+    assert res["data"]["resolution"] == "hour"
+    assert {"fwlogs", "minipot", "survey", "proxy"} == res["data"]["history"].keys()
+
+
+def test_get_statistics(file_root_init, infrastructure):
+    res = infrastructure.process_message(
+        {"module": "sentinel", "action": "get_statistics", "kind": "request"}
+    )
+    assert "error" not in res
+    assert {"interval", "totals", "series"} == res["data"].keys()
+    assert res["data"]["totals"]["minipot.ftp_connections"] == 120
+
+
+def test_get_metrics(updater_userlists, updater_languages, file_root_init, infrastructure, uci_configs_init):
+    infrastructure.process_message(
+        {"module": "sentinel", "action": "get_settings", "kind": "request"}
+    )
+    res = infrastructure.process_message(
+        {"module": "sentinel", "action": "get_metrics", "kind": "request"}
+    )
+    assert "error" not in res
+    stages = res["data"]["stages"]
+    assert {"uci_read", "package_lists", "subprocess", "eula_io", "notify"} == stages.keys()
+    for stage in stages.values():
+        assert len(stage["buckets"]) == len(res["data"]["bounds_ms"]) + 1
+        assert sum(stage["buckets"]) == stage["count"]
+
+
+def test_get_eula_chunks(file_root_init, infrastructure, uci_configs_init):
+    text = ""
+    offset = 0
+    while offset is not None:
+        res = infrastructure.process_message(
+            {
+                "module": "sentinel",
+                "action": "get_eula",
+                "kind": "request",
+                "data": {"version": 1, "offset": offset, "length": 4},
+            }
+        )
+        assert res["data"]["offset"] == offset
+        assert res["data"]["size"] == len("First version\n")
+        assert res["data"]["etag"] == etag("First version\n")
+        text += res["data"]["text"]
+        offset = res["data"]["next_offset"]
+
+    assert text == "First version\n"
+
+
 @pytest.mark.only_backends(["openwrt"])
 def test_get_than_update(
     updater_userlists, updater_languages, file_root_init, infrastructure, init_script_result, uci_configs_init
@@ -371,6 +773,7 @@ def test_get_state(file_root_init, infrastructure, sentinel_status):
     assert res["data"]["minipot"] in valid_states
     assert res["data"]["survey"] in valid_states
     assert res["data"]["proxy"] in valid_states
+    assert res["data"]["age"] >= 0
 
 
 @pytest.mark.only_backends(["openwrt"])
@@ -390,8 +793,8 @@ def test_get_state(file_root_init, infrastructure, sentinel_status):
 )
 def test_get_different_valid_states(file_root_init, infrastructure, sentinel_status, expected_states):
     """ Test multiple valid states """
-    res = infrastructure.process_message(
-        {"module": "sentinel", "action": "get_state", "kind": "request"}
+    res = get_state_when(
+        infrastructure, lambda state: state["fwlogs"] == expected_states[0] and state["proxy"] == expected_states[3]
     )
 
     assert "error" not in res
@@ -406,9 +809,7 @@ def test_get_different_valid_states(file_root_init, infrastructure, sentinel_sta
 @pytest.mark.parametrize("sentinel_status", [("FOO", "bAr", "Quux", "SomethingCompletelyDifferent")], indirect=True)
 def test_get_unexpected_states(file_root_init, infrastructure, sentinel_status):
     """ Test that even with unexpected states, backend would return default value 'unknown' """
-    res = infrastructure.process_message(
-        {"module": "sentinel", "action": "get_state", "kind": "request"}
-    )
+    res = get_state_when(infrastructure, lambda state: set(state.values()) == {"unknown"})
 
     assert "error" not in res
 
@@ -421,9 +822,7 @@ def test_get_unexpected_states(file_root_init, infrastructure, sentinel_status):
 @pytest.mark.only_backends(["openwrt"])
 def test_get_malformed_states(file_root_init, infrastructure, sentinel_status_malformed_data):
     """ Test that even with malformed data, backend would return state 'uninstalled'"""
-    res = infrastructure.process_message(
-        {"module": "sentinel", "action": "get_state", "kind": "request"}
-    )
+    res = get_state_when(infrastructure, lambda state: set(state.values()) == {"uninstalled"})
 
     assert "error" not in res
 
@@ -431,3 +830,45 @@ def test_get_malformed_states(file_root_init, infrastructure, sentinel_status_ma
     assert res["data"]["minipot"] == "uninstalled"
     assert res["data"]["survey"] == "uninstalled"
     assert res["data"]["proxy"] == "uninstalled"
+
+
+@pytest.mark.only_backends(["openwrt"])
+@pytest.mark.parametrize("sentinel_status", [("RUNNING", "RUNNING", "RUNNING", "RUNNING")], indirect=True)
+def test_state_changed(file_root_init, infrastructure, sentinel_status):
+    """ Test that change of components state is announced """
+    filters = [("sentinel", "state_changed")]
+
+    get_state_when(infrastructure, lambda state: set(state.values()) == {"running"})
+    notifications = infrastructure.get_notifications(filters=filters)
+
+    content = """\
+        #!/bin/sh
+        echo "FWLogs: RUNNING"
+        echo "Minipot: FAILED"
+        echo "Turris Survey: RUNNING"
+        echo "Server Connection: RUNNING"
+    """
+    with FileFaker(CMDLINE_SCRIPT_ROOT, "/usr/bin/sentinel-status", True, textwrap.dedent(content)):
+        notifications = infrastructure.get_notifications(notifications, filters=filters)
+        assert notifications[-1] == {
+            "module": "sentinel",
+            "action": "state_changed",
+            "kind": "notification",
+            "data": {"fwlogs": "running", "minipot": "failed", "survey": "running", "proxy": "running"},
+        }
+
+    res = infrastructure.process_message(
+        {
+            "module": "sentinel",
+            "action": "get_state_history",
+            "kind": "request",
+            "data": {"component": "minipot", "since": time.time() - 3600},
+        }
+    )
+    assert "error" not in res
+    assert [e[1] for e in res["data"]["history"]["minipot"]][-2:] == ["running", "failed"]
+
+    res = infrastructure.process_message(
+        {"module": "sentinel", "action": "get_state_history", "kind": "request", "data": {"resolution": "minute"}}
+    )
+    assert res["data"]["history"]["minipot"][-1][2] == "failed"
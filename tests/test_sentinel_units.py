@@ -0,0 +1,267 @@
+#
+# foris-controller-sentinel-module
+# Copyright (C) 2025 CZ.NIC, z.s.p.o. (http://www.nic.cz/)
+#
+# This program is free software; you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation; either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program; if not, write to the Free Software Foundation,
+# Inc., 51 Franklin Street, Fifth Floor, Boston, MA 02110-1301  USA
+#
+
+
+""" Tests of sentinel module parts which don't need a running controller """
+
+import importlib.util
+import json
+import jsonschema
+import os
+import pytest
+import threading
+import time
+
+from foris_controller_backends import sentinel
+from foris_controller_backends.sentinel import SentinelEulas, SentinelStatus, SentinelUci
+from foris_controller_backends.sentinel.commands import CircuitBreaker, CommandTimeout, run_command
+from foris_controller_sentinel_module.notifications import NotificationCoalescer
+
+from . import validators
+
+
+def test_validators():
+    """ Test that message is validated by the validator picked by its kind and action """
+    assert ("request", "get_settings") in validators.VALIDATORS
+    assert ("notification", "state_changed") in validators.VALIDATORS
+
+    validators.validate({"module": "sentinel", "kind": "request", "action": "get_fakepot_settings"})
+    validators.validate(
+        {
+            "module": "sentinel",
+            "kind": "reply",
+            "action": "get_fakepot_settings",
+            "data": {"enabled": True, "extra_option": ""},
+        }
+    )
+
+    with pytest.raises(jsonschema.ValidationError):
+        validators.validate(
+            {"module": "sentinel", "kind": "reply", "action": "get_fakepot_settings", "data": {"enabled": True}}
+        )
+
+    with pytest.raises(jsonschema.ValidationError):
+        validators.validate({"module": "sentinel", "kind": "request", "action": "non_existing"})
+
+
+def test_notification_coalescer():
+    sent = []
+    received = threading.Semaphore(0)
+
+    def send(action, data):
+        sent.append((action, data))
+        received.release()
+
+    coalescer = NotificationCoalescer(send, 0.2)
+
+    for i in range(5):
+        coalescer.push("update_fakepot_settings", {"enabled": True, "extra_option": str(i)})
+    coalescer.push("update_settings", {"eula": 1})
+
+    assert received.acquire(timeout=5) and received.acquire(timeout=5)
+    assert sorted(sent) == [
+        ("update_fakepot_settings", {"enabled": True, "extra_option": "4"}),
+        ("update_settings", {"eula": 1}),
+    ]
+
+    # a new window is opened
+    coalescer.push("update_settings", {"eula": 2})
+    assert received.acquire(timeout=5)
+    assert sent[-1] == ("update_settings", {"eula": 2})
+    assert len(sent) == 3
+
+
+def test_parse_status_output():
+    expected = {"fwlogs": "running", "minipot": "sending", "survey": "unknown", "proxy": "uninstalled"}
+    assert SentinelStatus.parse(b"FWLogs: RUNNING\nMinipot: SENDING\nTurris Survey: FOO\n") == expected
+    assert SentinelStatus.parse_json(b'{"FWLogs": "RUNNING", "Minipot": "SENDING", "Turris Survey": "FOO"}') == expected
+
+    # plain output is not structured
+    assert SentinelStatus.parse_json(b"FWLogs: RUNNING\n") is None
+    assert SentinelStatus.parse_json(None) is None
+    assert SentinelStatus.parse(None) == {
+        "fwlogs": "uninstalled", "minipot": "uninstalled", "survey": "uninstalled", "proxy": "uninstalled"
+    }
+
+
+def test_command_timeout_and_breaker():
+    assert run_command(["/bin/sh", "-c", "echo 42; exit 3"], timeout=1.0) == (3, b"42\n", b"")
+
+    # the command is killed, not waited for
+    start = time.monotonic()
+    with pytest.raises(CommandTimeout):
+        run_command(["/bin/sleep", "10"], timeout=0.1)
+    assert time.monotonic() - start < 5
+
+    breaker = CircuitBreaker(2, 0.5)
+    breaker.failure()
+    assert breaker.allow()
+    breaker.failure()
+    assert breaker.is_open and not breaker.allow()
+
+    # a single call is let through after a while
+    time.sleep(0.6)
+    assert breaker.allow()
+    assert not breaker.allow()
+    breaker.success()
+    assert not breaker.is_open and breaker.allow()
+
+
+def test_status_failures_open_breaker(tmp_path, monkeypatch):
+    monkeypatch.setenv("FORIS_CMDLINE_ROOT", str(tmp_path))
+    status = SentinelStatus()
+    # sentinel-status exits with an error
+    status._status = lambda args: None
+
+    for _ in range(SentinelStatus.FAILURE_THRESHOLD):
+        assert status.probe() == SentinelStatus.parse(None)
+    assert status.breaker.is_open
+    assert status.probe() is None
+
+    # installed sentinel-status is called right away
+    command = tmp_path / "usr" / "bin" / "sentinel-status"
+    command.parent.mkdir(parents=True)
+    command.write_text("#!/bin/sh\necho 'FWLogs: RUNNING'\n")
+    command.chmod(0o755)
+    del status._status
+    assert status.probe()["fwlogs"] == "running"
+    assert not status.breaker.is_open
+
+
+def test_installed_modules_cache(tmp_path, monkeypatch):
+    """ Installed modules are taken from the cache until a package lists source changes """
+    assert sentinel._uci_config_path("pkglists") in SentinelUci._package_lists_sources()
+
+    source = tmp_path / "pkglists"
+    source.write_text("config pkglists 'pkglists'\n")
+    monkeypatch.setattr(SentinelUci, "_package_lists_sources", staticmethod(lambda: [str(source)]))
+    monkeypatch.setattr(SentinelUci, "_installed_cache", None)
+
+    enabled = {"minipot": False}
+    calls = []
+
+    def get_package_lists(lang):
+        calls.append(lang)
+        options = [{"name": "minipot", "enabled": enabled["minipot"]}, {"name": "other", "enabled": True}]
+        return [{"name": "datacollect", "options": options}]
+
+    monkeypatch.setattr(sentinel.Updater, "get_package_lists", staticmethod(get_package_lists))
+
+    assert SentinelUci._get_installed_modules() == {"minipot": False}
+    assert SentinelUci._get_installed_modules() == {"minipot": False}
+    assert len(calls) == 1
+
+    # minipot is enabled in the package lists
+    enabled["minipot"] = True
+    source.write_text("config pkglists 'pkglists'\n\tlist pkglist 'datacollect'\n")
+    assert SentinelUci._get_installed_modules() == {"minipot": True}
+    assert len(calls) == 2
+
+
+def test_monitor_notifies_without_requests(monkeypatch):
+    """ State changes are announced once the monitor is started, get_state is not needed """
+    monkeypatch.setattr(SentinelStatus, "INTERVAL", 0.05)
+    status = SentinelStatus()
+    status._structured = False
+    output = {"out": b"FWLogs: RUNNING\n"}
+    status._status = lambda args: output["out"]
+
+    changed = threading.Event()
+    status.notify = lambda action, data: changed.set() if action == "state_changed" else None
+    status.start()
+
+    # the first probe is not delayed by the interval
+    deadline = time.monotonic() + 5
+    while status._state is None and time.monotonic() < deadline:
+        time.sleep(0.01)
+    assert status._state["fwlogs"] == "running"
+
+    output["out"] = b"FWLogs: FAILED\n"
+    assert changed.wait(5)
+    assert status.get_state()["fwlogs"] == "failed"
+
+
+def test_empty_eula_catalogue(tmp_path, monkeypatch):
+    """ Replies are valid when EULAs.csv lists no eula """
+    (tmp_path / "EULAs.csv").write_text("")
+    monkeypatch.setattr(SentinelEulas, "EULAS_PATH_PREFIX", str(tmp_path))
+    monkeypatch.setattr(SentinelEulas, "_catalogue", None)
+
+    assert SentinelEulas.get_latest_eula_info() is None
+    eula = SentinelEulas.get_eula()
+    assert eula == {"version": 0, "text": None}
+
+    validators.validate({"module": "sentinel", "kind": "reply", "action": "get_eula", "data": eula})
+    validators.validate(
+        {
+            "module": "sentinel",
+            "kind": "reply",
+            "action": "get_all",
+            "data": {
+                "settings": {
+                    "eula": 0,
+                    "token": None,
+                    "modules": {
+                        "minipot": {
+                            "enabled": True,
+                            "installed": False,
+                            "protocols": {"ftp": True, "http": True, "smtp": True, "telnet": True},
+                        },
+                        "fwlogs": {"enabled": True, "installed": False},
+                        "survey": {"enabled": True, "installed": False},
+                    },
+                },
+                "fakepot": {"enabled": False, "extra_option": ""},
+                "state": {
+                    "fwlogs": "uninstalled", "minipot": "uninstalled", "survey": "uninstalled",
+                    "proxy": "uninstalled",
+                },
+                "eula": SentinelEulas.get_latest_eula_info(),
+            },
+        }
+    )
+
+
+def _load_benchmarks():
+    path = os.path.join(os.path.dirname(os.path.dirname(os.path.realpath(__file__))), "benchmarks", "bench_backends.py")
+    spec = importlib.util.spec_from_file_location("bench_backends", path)
+    module = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(module)
+    return module
+
+
+def test_benchmarks_work(tmp_path, monkeypatch):
+    """ Work done by the benchmarked calls doesn't exceed benchmarks/baseline.json """
+    bench = _load_benchmarks()
+    for name, value in bench.prepare_root(str(tmp_path)).items():
+        monkeypatch.setenv(name, value)
+    monkeypatch.setattr(SentinelUci, "_config", None)
+    monkeypatch.setattr(SentinelUci, "_installed_cache", None)
+    monkeypatch.setattr(SentinelEulas, "_catalogue", None)
+    options = [{"name": name, "enabled": True} for name in SentinelUci._SENTINEL_MODULES]
+    monkeypatch.setattr(
+        sentinel.Updater, "get_package_lists", staticmethod(lambda lang: [{"name": "datacollect", "options": options}])
+    )
+
+    with open(bench.BASELINE) as f:
+        baseline = json.load(f)
+
+    functions = bench.benchmarks()
+    results = {name: bench.measure(functions[name], 3) for name in baseline}
+    assert bench.compare(results, baseline) == []
@@ -0,0 +1,67 @@
+#
+# foris-controller-sentinel-module
+# Copyright (C) 2025 CZ.NIC, z.s.p.o. (http://www.nic.cz/)
+#
+# This program is free software; you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation; either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program; if not, write to the Free Software Foundation,
+# Inc., 51 Franklin Street, Fifth Floor, Boston, MA 02110-1301  USA
+#
+
+""" Validators of sentinel messages dispatched by (kind, action)
+
+Test helper which checks messages built outside of the controller (e.g.
+replies of backends called directly). Each alternative of the top-level
+oneOf of the schema is compiled into its own validator, so a failure
+reports what is wrong with the message instead of that no alternative
+matched.
+"""
+
+import json
+import os
+import typing
+
+from jsonschema import Draft4Validator, ValidationError
+
+SCHEMA_PATH = os.path.join(
+    os.path.dirname(os.path.dirname(os.path.realpath(__file__))),
+    "foris_controller_modules", "sentinel", "schema", "sentinel.json",
+)
+
+
+def _compile(path: str) -> typing.Dict[typing.Tuple[str, str], Draft4Validator]:
+    with open(path) as f:
+        schema = json.load(f)
+
+    res = {}
+    for alternative in schema["oneOf"]:
+        properties = alternative["properties"]
+        for kind in properties["kind"]["enum"]:
+            for action in properties["action"]["enum"]:
+                # refs inside the alternative point to the shared definitions
+                res[(kind, action)] = Draft4Validator(dict(alternative, definitions=schema["definitions"]))
+    return res
+
+
+VALIDATORS = _compile(SCHEMA_PATH)
+
+
+def validate(message: dict):
+    """ Validate sentinel message
+
+    :raises jsonschema.ValidationError: when the message is not valid
+    """
+    try:
+        validator = VALIDATORS[(message.get("kind"), message.get("action"))]
+    except KeyError:
+        raise ValidationError(f"Unknown message {message.get('kind')}/{message.get('action')}")
+    validator.validate(message)